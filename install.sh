@@ -38,6 +38,11 @@ cp -r "$SCRIPT_DIR/config" "$INSTALL_DIR/"
 cp -r "$SCRIPT_DIR/webapp" "$INSTALL_DIR/"
 cp "$SCRIPT_DIR/requirements.txt" "$INSTALL_DIR/"
 
+# Create the unprivileged user the web interface runs as
+echo "Creating autoshield user and group..."
+groupadd -f --system autoshield
+id -u autoshield >/dev/null 2>&1 || useradd --system -g autoshield --no-create-home --shell /usr/sbin/nologin autoshield
+
 # Create directories for logs and database
 echo "Creating directories for logs and database..."
 mkdir -p /var/log/autoshield
@@ -59,9 +64,12 @@ After=network.target
 [Service]
 Type=simple
 ExecStart=$INSTALL_DIR/venv/bin/python -m src.main
+ExecReload=/bin/kill -HUP \$MAINPID
 Restart=on-failure
 RestartSec=10
 User=root
+# Lets the daemon hand its control socket to the autoshield group without CAP_CHOWN
+SupplementaryGroups=autoshield
 WorkingDirectory=$INSTALL_DIR
 
 # Security settings
@@ -87,12 +95,15 @@ Type=simple
 ExecStart=$INSTALL_DIR/venv/bin/python $INSTALL_DIR/webapp/webapp.py
 Restart=on-failure
 RestartSec=10
-User=root
+User=autoshield
+Group=autoshield
 WorkingDirectory=$INSTALL_DIR
 
 # Security settings
-CapabilityBoundingSet=CAP_NET_ADMIN CAP_NET_RAW
-AmbientCapabilities=CAP_NET_ADMIN CAP_NET_RAW
+# Firewall changes go through the daemon's control socket, which is owned by
+# the autoshield group, so the web interface runs unprivileged
+CapabilityBoundingSet=
+NoNewPrivileges=true
 
 [Install]
 WantedBy=multi-user.target
@@ -101,6 +112,10 @@ EOF
 # Set permissions
 echo "Setting permissions..."
 chmod -R 750 "$INSTALL_DIR"
+chgrp -R autoshield "$INSTALL_DIR"
+# The web interface reads the database
+chgrp autoshield /var/lib/autoshield
+chmod 750 /var/lib/autoshield
 chmod 640 /etc/systemd/system/autoshield.service
 chmod 640 /etc/systemd/system/autoshield-web.service
 
@@ -0,0 +1,199 @@
+"""
+Load test for the web dashboard against a large synthetic database.
+
+Fills a database with synthetic attempts and blocks, then calls every
+dashboard route concurrently, with an in-process control server on the
+memory firewall backend standing in for the daemon, and reports latency
+percentiles and the query plans of the dashboard and snapshot queries.
+
+    python scripts/loadtest.py --attempts 10000000 --blocks 500000
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import threading
+import importlib
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import yaml
+from flask import message_flashed
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+INSERT_CHUNK = 100_000
+
+def synthetic_ip(rng: random.Random, pool_size: int) -> str:
+    n = rng.randrange(pool_size)
+    return f"10.{n >> 16 & 255}.{n >> 8 & 255}.{n & 255}"
+
+def fill_database(db_path: str, attempts: int, blocks: int, seed: int) -> None:
+    """
+    Insert synthetic attempts and blocks spread over the last 30 days
+
+    Args:
+        db_path: Database to fill, its schema must already exist
+        attempts: Number of attempts to insert
+        blocks: Number of blocks to insert
+        seed: Random seed
+    """
+    rng = random.Random(seed)
+    now = datetime.now()
+    span_seconds = 30 * 24 * 3600
+    pool_size = max(blocks * 2, 1)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+
+    def attempt_rows():
+        for _ in range(attempts):
+            ip = synthetic_ip(rng, pool_size)
+            timestamp = now - timedelta(seconds=rng.randrange(span_seconds))
+            message = f"Failed password for root from {ip} port {rng.randrange(1024, 65536)} ssh2"
+            details = str({'SYSLOG_IDENTIFIER': 'sshd', 'MESSAGE': message})
+            yield ip, timestamp.isoformat(), details
+
+    block_counts: Dict[str, int] = {}
+    def block_rows():
+        for _ in range(blocks):
+            ip = synthetic_ip(rng, pool_size)
+            block_counts[ip] = block_counts.get(ip, 0) + 1
+            start = now - timedelta(seconds=rng.randrange(span_seconds))
+            expiry = start + timedelta(minutes=rng.choice([1, 60, 1440, 4320, 60 * 24 * 60]))
+            yield ip, start.isoformat(), expiry.isoformat(), block_counts[ip]
+
+    started = time.perf_counter()
+    for sql, rows, total in (
+        ('INSERT INTO attempts (ip, timestamp, details) VALUES (?, ?, ?)', attempt_rows(), attempts),
+        ('INSERT INTO blocks (ip, block_timestamp, expiry_timestamp, block_count) VALUES (?, ?, ?, ?)',
+         block_rows(), blocks),
+    ):
+        inserted = 0
+        while inserted < total:
+            chunk = [row for _, row in zip(range(INSERT_CHUNK), rows)]
+            with conn:
+                conn.executemany(sql, chunk)
+            inserted += len(chunk)
+    conn.close()
+    print(f"Filled {attempts} attempts and {blocks} blocks in {time.perf_counter() - started:.1f}s")
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def run_load(app: Any, requests_per_route: int, concurrency: int, seed: int) -> None:
+    """
+    Call every route concurrently and print latency percentiles. A request
+    fails on an unexpected status or when the page flashes an error, which
+    is how the dashboard reports a failed control request.
+    """
+    rng = random.Random(seed)
+    routes: List[Tuple[str, str, int, Any]] = [
+        ('GET /', 'get', 200, lambda: ('/', None)),
+        ('GET /snapshot', 'get', 200, lambda: ('/snapshot', None)),
+        ('GET /api/traces', 'get', 200, lambda: ('/api/traces', None)),
+        ('POST /block', 'post', 302, lambda: ('/block', {'ip': synthetic_ip(rng, 1 << 24), 'duration': '60'})),
+        ('POST /unblock/<ip>', 'post', 302, lambda: (f'/unblock/{synthetic_ip(rng, 1 << 24)}', None)),
+    ]
+    local = threading.local()
+
+    # The test client runs the request in the calling thread
+    def record_flash(sender: Any, message: str, category: str) -> None:
+        if category == 'danger':
+            local.failed = True
+    message_flashed.connect(record_flash, app)
+
+    def call(method: str, path: str, expected_status: int, data: Any) -> Tuple[float, bool]:
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        local.failed = False
+        started = time.perf_counter()
+        response = getattr(local.client, method)(path, data=data)
+        response.get_data()
+        return time.perf_counter() - started, local.failed or response.status_code != expected_status
+
+    print(f"\n{'route':<22}{'n':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}")
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, method, expected_status, make_request in routes:
+            futures = [
+                pool.submit(call, method, path, expected_status, data)
+                for path, data in (make_request() for _ in range(requests_per_route))
+            ]
+            results = [future.result() for future in futures]
+            latencies = sorted(latency * 1000 for latency, _ in results)
+            errors = sum(1 for _, failed in results if failed)
+            print(f"{name:<22}{len(latencies):>6}{percentile(latencies, 0.5):>10.1f}"
+                  f"{percentile(latencies, 0.99):>10.1f}{latencies[-1]:>10.1f}{errors:>8}")
+
+def explain(db_path: str, queries: Dict[str, str]) -> None:
+    """
+    Print EXPLAIN QUERY PLAN for each query
+    """
+    conn = sqlite3.connect(db_path)
+    for name, sql in queries.items():
+        print(f"\n{name}:")
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+            print(f"  {row[-1]}")
+    conn.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the AutoShield dashboard")
+    parser.add_argument('--db', help="Database path (default: a temporary file)")
+    parser.add_argument('--attempts', type=int, default=1_000_000, help="Synthetic attempts to insert")
+    parser.add_argument('--blocks', type=int, default=50_000, help="Synthetic blocks to insert")
+    parser.add_argument('--no-fill', action='store_true', help="Reuse the existing database as is")
+    parser.add_argument('--requests', type=int, default=50, help="Requests per route")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='autoshield-loadtest-')
+    db_path = args.db or os.path.join(work_dir, 'database.db')
+    config_path = os.path.join(work_dir, 'config.yaml')
+    with open(os.path.join(REPO_DIR, 'config', 'config.yaml')) as f:
+        config = yaml.safe_load(f)
+    config['database']['path'] = os.path.abspath(db_path)
+    config['logging']['file_path'] = os.path.join(work_dir, 'autoshield.log')
+    config['logging']['console'] = False
+    # Keep the chain in memory instead of calling nft
+    config['firewall']['backend'] = 'memory'
+    config['control'] = {'enabled': True, 'socket_path': os.path.join(work_dir, 'control.sock')}
+    config['webapp'] = {'mode': 'control'}
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f)
+    os.environ['AUTOSHIELD_CONFIG'] = config_path
+
+    from src.logger import Logger, OFFENDERS_QUERY
+    from src.firewall import Firewall
+    from src.control import ControlServer
+
+    # Stand-in for the daemon; Logger also creates the schema
+    logger = Logger(config)
+    control_server = ControlServer(config, logger, Firewall(config, logger))
+    control_server.start()
+
+    if not args.no_fill:
+        fill_database(db_path, args.attempts, args.blocks, args.seed)
+
+    webapp = importlib.import_module('webapp.webapp')
+    try:
+        run_load(webapp.create_app(config_path), args.requests, args.concurrency, args.seed)
+    finally:
+        control_server.stop()
+        logger.close()
+    explain(db_path, {
+        'recent attempts': webapp.RECENT_ATTEMPTS_QUERY,
+        'active blocks': webapp.ACTIVE_BLOCKS_QUERY,
+        'offenders (snapshot export)': OFFENDERS_QUERY,
+    })
+    print(f"\nDatabase: {db_path}")
+
+if __name__ == '__main__':
+    main()
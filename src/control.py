@@ -0,0 +1,211 @@
+import os
+import grp
+import json
+import base64
+import socket
+import logging
+import ipaddress
+import threading
+import socketserver
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Optional
+
+from src.snapshot import import_snapshot, SnapshotError
+from src.tracing import tracer
+
+DEFAULT_SOCKET_PATH = '/run/autoshield/control.sock'
+
+class ControlError(Exception):
+    """
+    Raised when a control request cannot be completed
+    """
+
+def socket_path(config: Dict[str, Any]) -> str:
+    return (config.get('control') or {}).get('socket_path') or DEFAULT_SOCKET_PATH
+
+def socket_group(config: Dict[str, Any]) -> Optional[str]:
+    return (config.get('control') or {}).get('socket_group')
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """
+    Handles one JSON request line and answers with one JSON response line
+    """
+    def handle(self) -> None:
+        try:
+            request = json.loads(self.rfile.readline())
+            result = self.server.control.dispatch(request.get('command'), request.get('args') or {})
+            response = {'ok': True, 'result': result}
+        except ControlError as e:
+            response = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            logging.getLogger('autoshield').error("Control request failed: %s", e)
+            response = {'ok': False, 'error': f"Internal error: {e}"}
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class _ControlSocketServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Every web worker thread may connect at once
+    request_queue_size = 128
+
+class ControlServer:
+    """
+    Local control socket through which other processes (the web interface)
+    ask the daemon to change the firewall, so they need no nft access
+    """
+    def __init__(self, config: Dict[str, Any], logger: Any, firewall: Any):
+        """
+        Initialize the control server
+
+        Args:
+            config: Config dict from config.yaml
+            logger: Logger instance
+            firewall: Firewall instance
+        """
+        self.logger = logger
+        self.firewall = firewall
+        self.socket_path = socket_path(config)
+        self.socket_group = socket_group(config)
+        self.log = logging.getLogger('autoshield')
+        self.commands: Dict[str, Callable[..., Any]] = {
+            'block': self._block,
+            'unblock': self._unblock,
+            'blocked': self._blocked,
+            'import_snapshot': self._import_snapshot,
+            'traces': self._traces,
+        }
+        self._server: Optional[_ControlSocketServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """
+        Bind the socket and serve requests in a background thread
+        """
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._server = _ControlSocketServer(self.socket_path, _ControlHandler)
+        self._server.control = self
+        os.chmod(self.socket_path, 0o660)
+        if self.socket_group:
+            # Lets the unprivileged web interface connect
+            try:
+                os.chown(self.socket_path, -1, grp.getgrnam(self.socket_group).gr_gid)
+            except (KeyError, OSError) as e:
+                self.log.warning("Could not give group %s access to the control socket: %s", self.socket_group, e)
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name='autoshield-control', daemon=True)
+        self._thread.start()
+        self.log.info("Control socket listening on %s", self.socket_path)
+
+    def stop(self) -> None:
+        """
+        Stop serving and remove the socket
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.log.info("Control socket closed")
+
+    def dispatch(self, command: str, args: Dict[str, Any]) -> Any:
+        handler = self.commands.get(command)
+        if handler is None:
+            raise ControlError(f"Unknown command {command!r}")
+        try:
+            return handler(**args)
+        except TypeError as e:
+            raise ControlError(f"Bad arguments for {command}: {e}")
+
+    @staticmethod
+    def _check_ip(ip: str) -> str:
+        try:
+            return str(ipaddress.IPv4Address(ip))
+        except ValueError:
+            raise ControlError(f"Invalid IP address {ip!r}")
+
+    @staticmethod
+    def _check_expiry(block_start: datetime, duration: Any) -> datetime:
+        try:
+            minutes = int(duration)
+            if minutes > 0:
+                return block_start + timedelta(minutes=minutes)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        raise ControlError(f"Invalid duration {duration!r}, expected a positive number of minutes")
+
+    def _block(self, ip: str, duration: int = 60) -> bool:
+        ip = self._check_ip(ip)
+        block_start = datetime.now()
+        expiry = self._check_expiry(block_start, duration)
+        if not self.firewall.block_ip(ip):
+            return False
+        self.logger.log_block(ip, block_start, expiry)
+        return True
+
+    def _unblock(self, ip: str) -> bool:
+        ip = self._check_ip(ip)
+        if not self.firewall.unblock_ip(ip):
+            return False
+        self.logger.log_unblock(ip)
+        return True
+
+    def _blocked(self) -> list:
+        return self.firewall.get_blocked_ips()
+
+    def _import_snapshot(self, data: str) -> Dict[str, int]:
+        try:
+            records, blocked = import_snapshot(base64.b64decode(data), self.logger, self.firewall)
+        except SnapshotError as e:
+            raise ControlError(f"Invalid snapshot: {e}")
+        return {'records': records, 'blocked': blocked}
+
+    def _traces(self) -> Dict[str, Any]:
+        return tracer.to_trace_events()
+
+class ControlClient:
+    """
+    Sends requests to the daemon's control socket
+    """
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        """
+        Initialize the client
+
+        Args:
+            socket_path: Path of the daemon's control socket
+            timeout: Seconds to wait for a response
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def request(self, command: str, **args: Any) -> Any:
+        """
+        Send a command and wait for its result
+
+        Args:
+            command: Command name
+            args: Command arguments
+
+        Returns:
+            The command's result
+        """
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                # A timeout makes connect non-blocking, which fails at once with
+                # EAGAIN instead of waiting when the listen backlog is full
+                sock.connect(self.socket_path)
+                sock.settimeout(self.timeout)
+                sock.sendall(json.dumps({'command': command, 'args': args}).encode('utf-8') + b'\n')
+                with sock.makefile('rb') as f:
+                    line = f.readline()
+        except OSError as e:
+            raise ControlError(f"AutoShield daemon is not reachable at {self.socket_path}: {e}")
+
+        if not line:
+            raise ControlError("AutoShield daemon closed the connection")
+        response = json.loads(line)
+        if not response.get('ok'):
+            raise ControlError(response.get('error') or "Request failed")
+        return response.get('result')
@@ -1,22 +1,291 @@
+import abc
+import json
 import subprocess
+import threading
 import logging
 from typing import Dict, List, Set, Any, Optional, Union, Callable
 
+from src.tracing import tracer
+
+TABLE = {'family': 'inet', 'name': 'autoshield'}
+CHAIN = {'family': 'inet', 'table': 'autoshield', 'name': 'input'}
+RULE = {'family': 'inet', 'table': 'autoshield', 'chain': 'input'}
+# Blocked addresses live in one set matched by a single drop rule, so packet
+# filtering is a hash lookup and blocking many IPs is one element update
+SET = {'family': 'inet', 'table': 'autoshield', 'name': 'blocklist'}
+SADDR = {'payload': {'protocol': 'ip', 'field': 'saddr'}}
+
+class FirewallError(Exception):
+    """
+    Raised when an nftables command fails
+    """
+
+class FirewallBackend(abc.ABC):
+    """
+    Applies changes to the autoshield blocklist. Every method that changes
+    it does so in a single nftables transaction.
+    """
+    @abc.abstractmethod
+    def ensure_table(self) -> bool:
+        """
+        Create the autoshield table, blocklist set and input chain if they
+        don't exist
+
+        Returns:
+            True if they were created
+        """
+
+    @abc.abstractmethod
+    def list_blocked(self) -> Set[str]:
+        """
+        Get the blocked IPs
+        """
+
+    @abc.abstractmethod
+    def add_block(self, ip: str) -> bool:
+        """
+        Block one IP without listing the blocklist first
+
+        Returns:
+            False if the IP was already blocked
+        """
+
+    @abc.abstractmethod
+    def add_blocks(self, ips: List[str]) -> None:
+        """
+        Block each IP, already blocked ones are left as they are
+        """
+
+    @abc.abstractmethod
+    def remove_blocks(self, ips: List[str]) -> None:
+        """
+        Unblock each IP, all of them must be blocked
+        """
+
+class JsonBackend(FirewallBackend):
+    """
+    Backend that talks to nftables through its JSON schema. Subclasses only
+    provide the transport in _json_cmd.
+    """
+    @abc.abstractmethod
+    def _json_cmd(self, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Run a batch of JSON commands as one transaction
+
+        Args:
+            commands: Items of the top level "nftables" array
+
+        Returns:
+            Items of the "nftables" array in the output, if any
+        """
+
+    @staticmethod
+    def _rule_target(rule: Dict[str, Any]) -> Optional[str]:
+        """
+        Get what a drop rule matches the source address against, an IP or
+        "@set", or None for any other rule
+        """
+        target = None
+        drops = False
+        for expr in rule.get('expr', []):
+            match = expr.get('match')
+            if match and match.get('left') == SADDR:
+                target = match.get('right')
+            elif 'drop' in expr:
+                drops = True
+        if isinstance(target, str) and drops:
+            return target
+        return None
+
+    def ensure_table(self) -> bool:
+        try:
+            items = self._json_cmd([{'list': {'chain': CHAIN}}])
+        except FirewallError:
+            items = None
+
+        set_rule = [
+            {'add': {'set': dict(SET, type='ipv4_addr')}},
+            {'add': {'rule': dict(RULE, expr=[
+                {'match': {'op': '==', 'left': SADDR, 'right': f"@{SET['name']}"}},
+                {'counter': {'packets': 0, 'bytes': 0}},
+                {'drop': None},
+            ])}},
+        ]
+        if items is None:
+            self._json_cmd([
+                {'add': {'table': TABLE}},
+                {'add': {'chain': dict(CHAIN, type='filter', hook='input', prio=0, policy='accept')}},
+            ] + set_rule)
+            return True
+
+        # Older versions added one rule per IP, move those into the set
+        legacy_rules = {}
+        has_set_rule = False
+        for item in items:
+            rule = item.get('rule')
+            target = self._rule_target(rule) if rule else None
+            if target == f"@{SET['name']}":
+                has_set_rule = True
+            elif target is not None and not target.startswith('@'):
+                legacy_rules[target] = rule['handle']
+
+        commands = [] if has_set_rule else set_rule
+        if legacy_rules:
+            commands.append({'add': {'element': dict(SET, elem=list(legacy_rules))}})
+            commands.extend({'delete': {'rule': dict(RULE, handle=handle)}} for handle in legacy_rules.values())
+        if commands:
+            self._json_cmd(commands)
+        return not has_set_rule
+
+    def list_blocked(self) -> Set[str]:
+        blocked = set()
+        for item in self._json_cmd([{'list': {'set': SET}}]):
+            for elem in (item.get('set') or {}).get('elem', []):
+                # Elements with extra data (counters, timeouts) are wrapped
+                if isinstance(elem, dict):
+                    elem = (elem.get('elem') or {}).get('val')
+                if isinstance(elem, str):
+                    blocked.add(elem)
+        return blocked
+
+    def add_block(self, ip: str) -> bool:
+        try:
+            self._json_cmd([{'create': {'element': dict(SET, elem=[ip])}}])
+            return True
+        except FirewallError as e:
+            # create, unlike add, fails with EEXIST when the element exists
+            if 'File exists' in str(e):
+                return False
+            raise
+
+    def add_blocks(self, ips: List[str]) -> None:
+        if ips:
+            self._json_cmd([{'add': {'element': dict(SET, elem=list(ips))}}])
+
+    def remove_blocks(self, ips: List[str]) -> None:
+        if ips:
+            self._json_cmd([{'delete': {'element': dict(SET, elem=list(ips))}}])
+
+class SubprocessBackend(JsonBackend):
+    """
+    Runs the nft binary for every command, used when the libnftables
+    Python bindings are not installed
+    """
+    def _json_cmd(self, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = subprocess.run(
+            ['nft', '-a', '-j', '-f', '-'],
+            input=json.dumps({'nftables': commands}), capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise FirewallError(result.stderr.strip() or f"nft exited with {result.returncode}")
+        if not result.stdout.strip():
+            return []
+        return json.loads(result.stdout).get('nftables', [])
+
+class LibnftablesBackend(JsonBackend):
+    """
+    Runs commands in-process through libnftables, reusing one context
+    """
+    def __init__(self):
+        import nftables
+        self._nft = nftables.Nftables()
+        self._nft.set_json_output(True)
+        self._nft.set_handle_output(True)
+        # A libnftables context must not be used from two threads at once
+        self._lock = threading.Lock()
+
+    def _json_cmd(self, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            rc, output, error = self._nft.json_cmd({'nftables': commands})
+        if rc != 0:
+            raise FirewallError(str(error).strip() or f"libnftables returned {rc}")
+        if not output:
+            return []
+        if isinstance(output, str):
+            output = json.loads(output)
+        return output.get('nftables', [])
+
+class MemoryBackend(FirewallBackend):
+    """
+    Keeps the blocklist in memory without touching nftables, for tests and
+    load testing
+    """
+    def __init__(self):
+        self.blocked: Set[str] = set()
+        self.table_exists = False
+        self._lock = threading.Lock()
+
+    def ensure_table(self) -> bool:
+        created = not self.table_exists
+        self.table_exists = True
+        return created
+
+    def list_blocked(self) -> Set[str]:
+        with self._lock:
+            return set(self.blocked)
+
+    def add_block(self, ip: str) -> bool:
+        with self._lock:
+            if ip in self.blocked:
+                return False
+            self.blocked.add(ip)
+            return True
+
+    def add_blocks(self, ips: List[str]) -> None:
+        with self._lock:
+            self.blocked.update(ips)
+
+    def remove_blocks(self, ips: List[str]) -> None:
+        with self._lock:
+            missing = set(ips) - self.blocked
+            if missing:
+                raise FirewallError(f"Not blocked: {sorted(missing)}")
+            self.blocked.difference_update(ips)
+
+def create_backend(name: str = 'auto') -> FirewallBackend:
+    """
+    Create a firewall backend by name
+
+    Args:
+        name: 'auto', 'libnftables', 'subprocess' or 'memory'. 'auto' uses
+            libnftables when its bindings are installed, otherwise subprocess
+
+    Returns:
+        The backend
+    """
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'subprocess':
+        return SubprocessBackend()
+    if name == 'libnftables':
+        return LibnftablesBackend()
+    if name == 'auto':
+        try:
+            return LibnftablesBackend()
+        except (ImportError, OSError):
+            logging.getLogger('autoshield').info("libnftables bindings not available, using nft subprocess")
+            return SubprocessBackend()
+    raise ValueError(f"Unknown firewall backend {name!r}")
+
 class Firewall:
-    def __init__(self, config: Dict[str, Any], logger: Any):
+    def __init__(self, config: Dict[str, Any], logger: Any, backend: Optional[FirewallBackend] = None):
         """
         Initialize the firewall using nftables
         
         Args:
             config: Config dict from config.yaml
             logger: logger instance
+            Optional backend: Backend to use instead of the one named in config
         """
         self.config = config
         self.logger = logger
         # self.whitelist = set(config['firewall'].get('whitelist',[]))
         self.whitelist = set(config.get('firewall', {}).get('whitelist') or [])
         
-
+        if backend is None:
+            backend = create_backend(config.get('firewall', {}).get('backend') or 'auto')
+        self.backend = backend
+        
         self._initialize_nftables()
     
     def _initialize_nftables(self) -> None:
@@ -24,95 +293,132 @@ class Firewall:
         Initialize nftables with table and chain if they don't exist
         """
         try:
-            check_table = subprocess.run(
-                ['nft', 'list', 'table', 'inet', 'autoshield'],
-                capture_output=True, text=True
-            )
-            
-            if check_table.returncode != 0:
-                subprocess.run([
-                    'nft', 'add', 'table', 'inet', 'autoshield'
-                ], check=True)
-                
-                subprocess.run([
-                    'nft', 'add', 'chain', 'inet', 'autoshield', 'input',
-                    '{ type filter hook input priority 0; policy accept; }'
-                ], check=True)
-                
-                logging.getLogger('autoshield').info("Created nftables table and chain")
-        except subprocess.CalledProcessError as e:
-            logging.getLogger('autoshield').error(f"Failed to initialize nftables: {e}")
+            if self.backend.ensure_table():
+                logging.getLogger('autoshield').info("Created nftables blocklist set and rule")
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to initialize nftables: %s", e)
             raise
     
+    def reload_config(self, config: Dict[str, Any]) -> None:
+        """
+        Swap in the whitelist from a new config
+        
+        Args:
+            config: New config dict from config.yaml
+        """
+        self.whitelist = set(config.get('firewall', {}).get('whitelist') or [])
+        self.config = config
+        logging.getLogger('autoshield').info("Firewall whitelist reloaded (%d entries)", len(self.whitelist))
+    
     def block_ip(self, ip: str) -> bool:
         """
-        Block an IP 
+        Block an IP
         
         Args:
             ip: The IP to block
-            
+        
         Returns:
             True if IP was blocked
         """
         if ip in self.whitelist:
-            logging.getLogger('autoshield').warning(f"Attempted to block whitelisted IP {ip}")
+            logging.getLogger('autoshield').warning("Attempted to block whitelisted IP %s", ip)
             return False
         
         try:
-            check_cmd = subprocess.run(
-                ['nft', 'list', 'chain', 'inet', 'autoshield', 'input'],
-                capture_output=True, text=True
-            )
-            
-            if f"ip saddr {ip}" in check_cmd.stdout:
-                logging.getLogger('autoshield').info(f"IP {ip} is already blocked")
+            with tracer.span('nft.add'):
+                added = self.backend.add_block(ip)
+            if not added:
+                logging.getLogger('autoshield').info("IP %s is already blocked", ip)
                 return False
             
-            subprocess.run([
-                'nft', 'add', 'rule', 'inet', 'autoshield', 'input',
-                'ip', 'saddr', ip, 'counter', 'drop'
-            ], check=True)
-            
-            logging.getLogger('autoshield').info(f"Successfully blocked IP {ip}")
+            logging.getLogger('autoshield').info("Successfully blocked IP %s", ip)
             return True
-            
-        except subprocess.CalledProcessError as e:
-            logging.getLogger('autoshield').error(f"Failed to block IP {ip}: {e}")
+        
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to block IP %s: %s", ip, e)
             return False
     
+    def block_ips(self, ips: List[str]) -> List[str]:
+        """
+        Block several IPs in a single nft transaction, skipping whitelisted
+        and already blocked ones. Lists the blocklist once, to report which
+        IPs are new
+        
+        Args:
+            ips: The IPs to block
+        
+        Returns:
+            List of IPs that were blocked
+        """
+        try:
+            already_blocked = self.backend.list_blocked()
+            new_ips = [
+                ip for ip in dict.fromkeys(ips)
+                if ip not in self.whitelist and ip not in already_blocked
+            ]
+            if not new_ips:
+                return []
+            
+            self.backend.add_blocks(new_ips)
+            
+            logging.getLogger('autoshield').info("Successfully blocked %d IPs", len(new_ips))
+            return new_ips
+        
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to block %d IPs: %s", len(ips), e)
+            return []
+    
     def unblock_ip(self, ip: str) -> bool:
         """
-        Unblock an IP address by removing the rule
+        Unblock an IP address by removing it from the blocklist
         
         Args:
             ip: The IP to unblock
-            
+        
         Returns:
             True if the IP was unblocked
         """
         try:
-            list_cmd = subprocess.run(
-                ['nft', '-a', 'list', 'chain', 'inet', 'autoshield', 'input'],
-                capture_output=True, text=True
-            )
+            if ip not in self.backend.list_blocked():
+                logging.getLogger('autoshield').info("IP %s was not found in blocked list", ip)
+                return False
             
-            for line in list_cmd.stdout.splitlines():
-                if f"ip saddr {ip}" in line and "handle" in line:
-                    handle = line.split("handle")[-1].strip().split()[0]
-                    
-                    subprocess.run([
-                        'nft', 'delete', 'rule', 'inet', 'autoshield', 'input', 'handle', handle
-                    ], check=True)
-                    
-                    logging.getLogger('autoshield').info(f"Successfully unblocked IP {ip}")
-                    return True
+            self.backend.remove_blocks([ip])
             
-            logging.getLogger('autoshield').info(f"IP {ip} was not found in blocked list")
+            logging.getLogger('autoshield').info("Successfully unblocked IP %s", ip)
+            return True
+        
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to unblock IP %s: %s", ip, e)
             return False
+    
+    def unblock_ips(self, ips: List[str]) -> List[str]:
+        """
+        Unblock several IPs in a single nft transaction
+        
+        Args:
+            ips: The IPs to unblock
+        
+        Returns:
+            List of IPs that were unblocked
+        """
+        wanted = set(ips)
+        if not wanted:
+            return []
+        
+        try:
+            unblocked = list(wanted & self.backend.list_blocked())
+            if not unblocked:
+                return []
             
-        except subprocess.CalledProcessError as e:
-            logging.getLogger('autoshield').error(f"Failed to unblock IP {ip}: {e}")
-            return False
+            self.backend.remove_blocks(unblocked)
+            
+            logging.getLogger('autoshield').info("Successfully unblocked %d IPs", len(unblocked))
+            return unblocked
+        
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to unblock IPs %s: %s", sorted(wanted), e)
+            return []
     
     def get_blocked_ips(self) -> List[str]:
         """
@@ -122,19 +428,8 @@ class Firewall:
             List of blocked IP addresses
         """
         try:
-            list_cmd = subprocess.run(
-                ['nft', 'list', 'chain', 'inet', 'autoshield', 'input'],
-                capture_output=True, text=True
-            )
-            
-            blocked_ips = []
-            for line in list_cmd.stdout.splitlines():
-                if "ip saddr" in line and "drop" in line:
-                    ip = line.split("ip saddr")[1].split()[0]
-                    blocked_ips.append(ip)
-            
-            return blocked_ips
-            
-        except subprocess.CalledProcessError as e:
-            logging.getLogger('autoshield').error(f"Failed to get blocked IPs: {e}")
+            return list(self.backend.list_blocked())
+        
+        except FirewallError as e:
+            logging.getLogger('autoshield').error("Failed to get blocked IPs: %s", e)
             return []
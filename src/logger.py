@@ -1,10 +1,34 @@
 import os
+import time
+import queue
 import logging
+import logging.handlers
 import sqlite3
 from datetime import datetime
 import threading
 from typing import Dict, List, Tuple, Optional, Any, Union
 
+from src.tracing import tracer
+
+# Latest block of every IP that has ever been blocked
+OFFENDERS_QUERY = '''
+    SELECT b.ip, b.expiry_timestamp, b.block_count
+    FROM blocks b
+    INNER JOIN (
+        SELECT ip, MAX(id) as max_id
+        FROM blocks
+        GROUP BY ip
+    ) m ON b.ip = m.ip AND b.id = m.max_id
+'''
+
+class _InProcessQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that skips the eager formatting done for cross-process queues,
+    so the message is only built on the listener thread
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 class Logger:
     def __init__(self, config: Dict[str, Any]):
         """
@@ -18,6 +42,12 @@ class Logger:
         self.setup_database()
         self.db_lock = threading.Lock()
 
+        # Per-IP attempt counts, summarised once per interval instead of one line per attempt
+        self.attempt_summary_interval = self.config['logging'].get('attempt_summary_interval', 10)
+        self._attempt_counts: Dict[str, int] = {}
+        self._attempt_window_start = time.monotonic()
+        self._summary_lock = threading.Lock()
+
     def setup_file_logging(self):
         """
         Setup up file logging with config
@@ -27,22 +57,33 @@ class Logger:
         os.makedirs(os.path.dirname(log_path), exist_ok=True)
         
         log_level = getattr(logging, self.config['logging']['level'])
-        
-        logging.basicConfig(
-            filename=log_path,
-            level=log_level,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         
-        self.logger = logging.getLogger('autoshield')
+        file_handler = logging.FileHandler(log_path)
+        file_handler.setFormatter(formatter)
+        handlers: List[logging.Handler] = [file_handler]
         
-
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(log_level)
-        console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
+        # Under systemd the console goes back into the journal, so it can be turned off
+        if self.config['logging'].get('console', True):
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
+            console_handler.addFilter(logging.Filter('autoshield'))
+            handlers.append(console_handler)
+        
+        # Callers only enqueue records; the listener thread does the file/console I/O
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.log_listener = logging.handlers.QueueListener(log_queue, *handlers)
+        
+        root_logger = logging.getLogger()
+        root_logger.setLevel(log_level)
+        self.queue_handler = _InProcessQueueHandler(log_queue)
+        root_logger.addHandler(self.queue_handler)
+        self.log_listener.start()
+        
+        self.logger = logging.getLogger('autoshield')
         
         self.logger.info("File logging initialized")
 
@@ -86,7 +127,8 @@ class Logger:
         self.conn.commit()
         self.logger.info("Database initialized")
     
-    def log_attempt(self, ip: str, timestamp: datetime, details: Optional[str] = None) -> None:
+    def log_attempt(self, ip: str, timestamp: datetime, details: Optional[str] = None,
+                    log_to_file: bool = True) -> None:
         """
         Log a failed connection attempt to both file and database
         
@@ -94,9 +136,11 @@ class Logger:
             ip: The IP that failed to connect
             timestamp: When the attempt occurred
             Optional details: Details about the attempt
+            Optional log_to_file: False to only write the database (used in storm mode)
         """
-        # Log to file
-        self.logger.info(f"Failed attempt from IP {ip} at {timestamp}: {details or 'No details'}")
+        # Log to file, only the first attempt per IP in each summary interval
+        if log_to_file:
+            self._count_attempt(ip, timestamp, details)
         
         # Log to database
         with self.db_lock:
@@ -105,7 +149,20 @@ class Logger:
                 'INSERT INTO attempts (ip, timestamp, details) VALUES (?, ?, ?)',
                 (ip, timestamp.isoformat(), details)
             )
-            self.conn.commit()
+            with tracer.span('sqlite.commit'):
+                self.conn.commit()
+    
+    def _count_attempt(self, ip: str, timestamp: datetime, details: Optional[str]) -> None:
+        """
+        Count an attempt for the per-IP summary, logging the first one in the interval
+        """
+        with self._summary_lock:
+            count = self._attempt_counts.get(ip, 0)
+            self._attempt_counts[ip] = count + 1
+        if count == 0:
+            self.logger.info("Failed attempt from IP %s at %s: %s", ip, timestamp, details or 'No details')
+        if time.monotonic() - self._attempt_window_start >= self.attempt_summary_interval:
+            self.flush_attempt_summary()
     
     def log_block(self, ip: str, block_timestamp: datetime, expiry_timestamp: datetime) -> None:
         """
@@ -131,8 +188,8 @@ class Logger:
             # Log to file
             duration_minutes = (expiry_timestamp - block_timestamp).total_seconds() / 60
             self.logger.warning(
-                f"Blocking IP {ip} at {block_timestamp} for {duration_minutes:.1f} minutes. "
-                f"Block count: {block_count}"
+                "Blocking IP %s at %s for %.1f minutes. Block count: %d",
+                ip, block_timestamp, duration_minutes, block_count
             )
             
             # Log to database
@@ -140,7 +197,8 @@ class Logger:
                 'INSERT INTO blocks (ip, block_timestamp, expiry_timestamp, block_count) VALUES (?, ?, ?, ?)',
                 (ip, block_timestamp.isoformat(), expiry_timestamp.isoformat(), block_count)
             )
-            self.conn.commit()
+            with tracer.span('sqlite.commit'):
+                self.conn.commit()
     
     def log_unblock(self, ip: str, timestamp: Optional[datetime] = None) -> None:
         """
@@ -152,7 +210,23 @@ class Logger:
         """
         if timestamp == None:
             timestamp = datetime.now()
-        self.logger.info(f"Unblocking IP {ip} at {timestamp}")
+        self.logger.info("Unblocking IP %s at %s", ip, timestamp)
+    
+    def flush_attempt_summary(self) -> None:
+        """
+        Log one summary line per IP with more than one attempt in the current
+        interval, then start a new interval
+        """
+        with self._summary_lock:
+            now = time.monotonic()
+            elapsed = now - self._attempt_window_start
+            counts = self._attempt_counts
+            self._attempt_counts = {}
+            self._attempt_window_start = now
+        
+        for ip, count in counts.items():
+            if count > 1:
+                self.logger.info("%d attempts from %s in last %.0fs", count, ip, elapsed)
         
     def get_recent_attempts(self, ip: str, time_window_minutes: int) -> List[datetime]:
         """
@@ -230,10 +304,90 @@ class Logger:
             
         return blocks
     
+    def get_offenders(self) -> List[Tuple[str, datetime, int]]:
+        """
+        Get the latest block of every IP that has ever been blocked
+        
+        Returns:
+            List of (ip, expiry_timestamp, block_count) tuples
+        """
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(OFFENDERS_QUERY)
+            offenders = [(row[0], datetime.fromisoformat(row[1]), row[2]) for row in cursor.fetchall()]
+            
+        return offenders
+    
+    def merge_offenders(self, offenders: List[Tuple[str, datetime, int]],
+                        now: Optional[datetime] = None) -> List[str]:
+        """
+        Merge offenders from another host into the blocks table in a single
+        transaction. Each IP keeps the later expiry and the higher block count
+        of its local latest block and the imported one. Imported blocks that
+        have already expired only raise the count of a local block, and are
+        skipped for IPs with no local history.
+        
+        Args:
+            offenders: List of (ip, expiry_timestamp, block_count) tuples
+            Optional now: Current time, or now if None
+            
+        Returns:
+            IPs whose block is active after the merge
+        """
+        if now is None:
+            now = datetime.now()
+        
+        inserts = []
+        count_updates = []
+        active = []
+        with self.db_lock:
+            with self.conn:
+                local = {}
+                for row_id, ip, expiry, count in self.conn.execute('''
+                    SELECT b.id, b.ip, b.expiry_timestamp, b.block_count
+                    FROM blocks b
+                    INNER JOIN (
+                        SELECT ip, MAX(id) as max_id
+                        FROM blocks
+                        GROUP BY ip
+                    ) m ON b.ip = m.ip AND b.id = m.max_id
+                '''):
+                    local[ip] = (row_id, datetime.fromisoformat(expiry), count)
+                
+                for ip, expiry, count in offenders:
+                    row_id, local_expiry, local_count = local.get(ip, (None, None, 0))
+                    block_count = max(count, local_count)
+                    
+                    if expiry > now and (local_expiry is None or expiry > local_expiry):
+                        # Imported block outlasts the local one
+                        inserts.append((ip, now.isoformat(), expiry.isoformat(), block_count))
+                    elif row_id is not None and block_count > local_count:
+                        count_updates.append((block_count, row_id))
+                    
+                    if max(expiry, local_expiry or expiry) > now:
+                        active.append(ip)
+                
+                self.conn.executemany(
+                    'INSERT INTO blocks (ip, block_timestamp, expiry_timestamp, block_count) VALUES (?, ?, ?, ?)',
+                    inserts
+                )
+                self.conn.executemany('UPDATE blocks SET block_count = ? WHERE id = ?', count_updates)
+        
+        self.logger.info(
+            "Merged %d offenders: %d blocks added, %d block counts raised",
+            len(offenders), len(inserts), len(count_updates)
+        )
+        return active
+    
     def close(self) -> None:
         """
-        Close database connection
+        Close database connection and stop the log listener
         """
         if hasattr(self, 'conn'):
             self.conn.close()
             self.logger.info("Database connection closed")
+        if hasattr(self, 'log_listener'):
+            self.flush_attempt_summary()
+            # Detach first so no record lands in a queue nothing reads any more
+            logging.getLogger().removeHandler(self.queue_handler)
+            self.log_listener.stop()
@@ -3,6 +3,7 @@ import sys
 import yaml
 import signal
 import logging
+import threading
 from pathlib import Path
 from typing import Dict, Any, Optional, Callable
 from datetime import datetime
@@ -10,7 +11,25 @@ from datetime import datetime
 from src.logger import Logger
 from src.firewall import Firewall
 from src.rules import RuleEngine
-from src.monitor import Monitor
+from src.monitor import Monitor, build_matchers, source_keywords
+from src.tracing import tracer
+from src.control import ControlServer
+
+# Serializes reloads when several SIGHUPs arrive close together
+_reload_lock = threading.Lock()
+
+def read_config(config_path: str) -> Dict[str, Any]:
+    """
+    Read config from file, raising on any error
+    
+    Args:
+        config_path: A path to the config file
+        
+    Returns:
+        Config dictionary
+    """
+    with open(config_path, 'r') as f:
+        return yaml.safe_load(f)
 
 def load_config(config_path: str) -> Dict[str, Any]:
     """
@@ -23,12 +42,57 @@ def load_config(config_path: str) -> Dict[str, Any]:
         Config dictionary
     """
     try:
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        return read_config(config_path)
     except Exception as e:
         print(f"Error loading configuration: {e}")
         sys.exit(1)
 
+def reload_config(config_path: str, logger: Logger, firewall: Firewall,
+                  rule_engine: RuleEngine, monitor: Monitor) -> None:
+    """
+    Re-read the config and swap it into the running components.
+    IPs that are now whitelisted are unblocked in one batch.
+    
+    Args:
+        config_path: A path to the config file
+        logger: Logger instance
+        firewall: Firewall instance
+        rule_engine: RuleEngine instance
+        monitor: Monitor instance
+    """
+    log = logging.getLogger('autoshield')
+    with _reload_lock:
+        try:
+            config = read_config(config_path)
+            # Build everything before swapping so a bad config changes nothing
+            rules_update = rule_engine.prepare_reload(config)
+            build_matchers(source_keywords(config))
+        except Exception as e:
+            log.error("Config reload failed, keeping current config: %s", e)
+            return
+        
+        monitor.reload_config(config)
+        firewall.reload_config(config)
+        rule_engine.reload_config(config, rules_update)
+        tracer.configure(config)
+        
+        now_whitelisted = [ip for ip in firewall.get_blocked_ips() if ip in firewall.whitelist]
+        for ip in firewall.unblock_ips(now_whitelisted):
+            logger.log_unblock(ip)
+        
+        log.info("Configuration reloaded from %s", config_path)
+
+def dump_traces() -> None:
+    """
+    Write the slowest decision traces to tracing.dump_path
+    """
+    log = logging.getLogger('autoshield')
+    try:
+        path = tracer.dump()
+        log.info("Wrote slowest traces to %s", path)
+    except Exception as e:
+        log.error("Failed to dump traces: %s", e)
+
 def main() -> None:
     """
     Main Function for AutoShield
@@ -43,6 +107,7 @@ def main() -> None:
     config = load_config(CONFIG_PATH)
     
     logger = Logger(config)
+    tracer.configure(config)
     log = logging.getLogger('autoshield')
     log.info("Starting AutoShield")
     
@@ -52,6 +117,12 @@ def main() -> None:
         
     rule_engine.start()
     
+    # Local socket the web interface uses to change the firewall
+    control_server = None
+    if (config.get('control') or {}).get('enabled', True):
+        control_server = ControlServer(config, logger, firewall)
+        control_server.start()
+    
     # callback for monitor
     def event_callback(ip: str, timestamp: datetime, details: str) -> None:
         rule_engine.process_attempt(ip, timestamp, details)
@@ -59,11 +130,30 @@ def main() -> None:
 
     monitor = Monitor(config, event_callback)
     
+    # Reload config on SIGHUP in a separate thread so monitoring keeps running
+    def handle_sighup(signum: int, frame: Any) -> None:
+        threading.Thread(
+            target=reload_config,
+            args=(CONFIG_PATH, logger, firewall, rule_engine, monitor),
+            name='autoshield-reload',
+            daemon=True,
+        ).start()
+    
+    signal.signal(signal.SIGHUP, handle_sighup)
+    
+    # Dump the slowest traces on SIGUSR1
+    def handle_sigusr1(signum: int, frame: Any) -> None:
+        threading.Thread(target=dump_traces, name='autoshield-traces', daemon=True).start()
+    
+    signal.signal(signal.SIGUSR1, handle_sigusr1)
+    
     try:
         monitor.start()
     except Exception as e:
         log.error(f"Error in main loop: {e}")
     finally:
+        if control_server is not None:
+            control_server.stop()
         rule_engine.stop()
         logger.close()
 
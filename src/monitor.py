@@ -1,8 +1,105 @@
 import re
+import time
 import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
 from systemd import journal
+from src.tracing import tracer
 from datetime import datetime
-from typing import Dict, Any, Callable, Pattern
+from typing import Dict, Any, Callable, Deque, List, Optional, Pattern, Tuple
+
+# Regular expression to extract IP addresses.
+IP_REGEX: Pattern[str] = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+
+# (syslog identifier, message, timestamp) as handed to the parsers.
+RawEvent = Tuple[str, str, datetime]
+# (position in the batch, ip) as handed back by the parsers.
+ParsedEvent = Tuple[int, str]
+# Journal wait while parser results are outstanding, bounds their extra latency.
+PENDING_POLL_INTERVAL = 0.01
+
+# Matchers of a parser pool worker, set once by _init_worker.
+_worker_matchers: Dict[str, Pattern[str]] = {}
+
+def compile_keywords(keywords: List[str]) -> Pattern[str]:
+    """
+    Compile a keyword list into a single regex.
+
+    Args:
+        keywords: Substrings that mark a failed attempt.
+
+    Returns:
+        Compiled pattern matching any of the keywords.
+    """
+    if not keywords:
+        return re.compile(r'(?!)')  # Never matches
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+def source_keywords(config: Dict[str, Any]) -> Dict[str, List[str]]:
+    """
+    Resolve the keywords to use for each monitored syslog identifier.
+    Identifiers under monitoring.sources use their own keywords, the rest
+    use monitoring.keywords.
+
+    Args:
+        config: Configuration dictionary.
+
+    Returns:
+        Mapping of syslog identifier to keyword list.
+    """
+    monitoring = config['monitoring']
+    default_keywords = monitoring.get('keywords') or []
+    keyword_map = {identifier: default_keywords for identifier in monitoring.get('syslog_identifiers') or []}
+    for identifier, source in (monitoring.get('sources') or {}).items():
+        keyword_map[identifier] = (source or {}).get('keywords') or default_keywords
+    return keyword_map
+
+def build_matchers(keyword_map: Dict[str, List[str]]) -> Dict[str, Pattern[str]]:
+    """
+    Compile one keyword matcher per syslog identifier.
+
+    Args:
+        keyword_map: Mapping of syslog identifier to keyword list.
+
+    Returns:
+        Mapping of syslog identifier to compiled pattern.
+    """
+    return {identifier: compile_keywords(keywords) for identifier, keywords in keyword_map.items()}
+
+def parse_events(matchers: Dict[str, Pattern[str]], batch: List[RawEvent]) -> List[ParsedEvent]:
+    """
+    Match raw journal messages against their source's keywords and extract the IP.
+
+    Args:
+        matchers: Mapping of syslog identifier to compiled pattern.
+        batch: Raw events to parse.
+
+    Returns:
+        Position in the batch and IP of each failed attempt.
+    """
+    results = []
+    for position, (identifier, message, _) in enumerate(batch):
+        matcher = matchers.get(identifier)
+        if matcher is None or matcher.search(message) is None:
+            continue
+        ip_match = IP_REGEX.search(message)
+        if ip_match:
+            results.append((position, ip_match.group(0)))
+    return results
+
+def _init_worker(keyword_map: Dict[str, List[str]]) -> None:
+    """
+    Parser pool initializer, compiles the matchers once per worker process.
+    """
+    global _worker_matchers
+    _worker_matchers = build_matchers(keyword_map)
+
+def _parse_batch_in_worker(batch: List[RawEvent]) -> List[ParsedEvent]:
+    """
+    Parser pool task, parses a batch with the worker's matchers.
+    """
+    return parse_events(_worker_matchers, batch)
 
 class Monitor:
     def __init__(self, config: Dict[str, Any], event_callback: Callable[[str, datetime, str], None]):
@@ -17,8 +114,18 @@ class Monitor:
         self.event_callback = event_callback
         self.logger = logging.getLogger('autoshield')
         
-        # Regular expression to extract IP addresses.
-        self.IP_REGEX: Pattern[str] = re.compile(r'\b(?:\d{1,3}\.){3}\d{1,3}\b')
+        # Compiled keyword matchers per syslog identifier.
+        self.keyword_map = source_keywords(self.config)
+        self.matchers: Dict[str, Pattern[str]] = build_matchers(self.keyword_map)
+        
+        # Parser pool, only used when parser_workers > 0.
+        self.parser_workers = self.config['monitoring'].get('parser_workers', 0)
+        self.parser_batch_size = self.config['monitoring'].get('parser_batch_size', 256)
+        self.parser_pool: Optional[ProcessPoolExecutor] = self._create_parser_pool()
+        # Submitted batches with their journal entries, which stay in this process
+        self._pending: Deque[Tuple[Future, List[Dict[str, Any]], List[RawEvent]]] = deque()
+        # Set by reload_config, the monitor thread replaces the pool between batches
+        self._pool_swap_requested = False
         
         # Set up the systemd journal reader.
         self.journal_reader = journal.Reader()
@@ -26,7 +133,7 @@ class Monitor:
         self.journal_reader.log_level(journal.LOG_INFO)  # Filter by INFO level and above.
         
         # Apply syslog identifier filters from the config.
-        for identifier in self.config['monitoring']['syslog_identifiers']:
+        for identifier in self.keyword_map:
             self.journal_reader.add_match(SYSLOG_IDENTIFIER=identifier)
         
         # Move to the tail to start reading new entries.
@@ -35,6 +142,59 @@ class Monitor:
         
         self.logger.info("Monitor initialized")
     
+    def _create_parser_pool(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Start the parser pool for the current keywords, if enabled.
+
+        Returns:
+            The executor, or None when parsing runs inline.
+        """
+        if self.parser_workers <= 0:
+            return None
+        self.logger.info("Starting parser pool with %d workers", self.parser_workers)
+        return ProcessPoolExecutor(
+            max_workers=self.parser_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.keyword_map,),
+        )
+    
+    def reload_config(self, config: Dict[str, Any]) -> None:
+        """
+        Swap in the keywords from a new config without stopping the monitor.
+        Syslog identifier changes still need a restart.
+
+        Args:
+            config: The new configuration dictionary.
+        """
+        keyword_map = source_keywords(config)
+        matchers = build_matchers(keyword_map)
+        if set(keyword_map) != set(self.keyword_map):
+            self.logger.warning("Monitored syslog identifiers changed; restart AutoShield to apply")
+        self.keyword_map = keyword_map
+        self.matchers = matchers
+        self.config = config
+        
+        # Workers compile their matchers once, so the pool has to be replaced.
+        # Only the monitor thread submits to it, so leave the swap to that thread.
+        if self.parser_pool is not None:
+            self._pool_swap_requested = True
+        self.logger.info("Monitor keywords reloaded")
+    
+    def _swap_parser_pool(self) -> None:
+        """
+        Replace the parser pool after a reload, once the batches already
+        submitted to the old one have been passed on. Monitor thread only.
+        """
+        if not self._pool_swap_requested:
+            return
+        self._pool_swap_requested = False
+        while self._pending:
+            self._collect_parsed(block=True)
+        old_pool = self.parser_pool
+        self.parser_pool = self._create_parser_pool()
+        old_pool.shutdown(wait=False)
+    
     def start(self) -> None:
         """
         Start monitoring the journal for failed login attempts.
@@ -42,49 +202,148 @@ class Monitor:
         self.logger.info("Starting journal monitoring")
         try:
             while True:
-                journal_events = self.journal_reader.wait(timeout=1)
+                # Poll quickly while batches are out so their results are not held back
+                journal_events = self.journal_reader.wait(timeout=PENDING_POLL_INTERVAL if self._pending else 1)
+                self._swap_parser_pool()
                 if journal_events == journal.APPEND:
-                    for entry in self.journal_reader:
-                        self._process_entry(entry)
+                    if self.parser_pool is None:
+                        for entry in self.journal_reader:
+                            self._process_entry(entry)
+                    else:
+                        self._dispatch_entries()
+                self._collect_parsed(block=False)
         except KeyboardInterrupt:
             self.logger.info("Monitoring stopped by user")
         except Exception as e:
             self.logger.error(f"Monitoring error: {e}")
             raise
+        finally:
+            if self.parser_pool is not None:
+                # Pass on the batches still in flight before stopping the pool
+                try:
+                    while self._pending:
+                        self._collect_parsed(block=True)
+                finally:
+                    self.parser_pool.shutdown()
     
-    def _process_entry(self, entry: Dict[str, Any]) -> None:
+    def _dispatch_entries(self) -> None:
         """
-        Process a journal entry to check for failed login attempts.
+        Hand new journal entries to the parser pool in batches.
+        """
+        entries: List[Dict[str, Any]] = []
+        batch: List[RawEvent] = []
+        for entry in self.journal_reader:
+            raw_event = self._to_raw_event(entry)
+            if raw_event is None:
+                continue
+            entries.append(entry)
+            batch.append(raw_event)
+            if len(batch) >= self.parser_batch_size:
+                self._submit_batch(entries, batch)
+                entries = []
+                batch = []
+        if batch:
+            self._submit_batch(entries, batch)
+    
+    def _submit_batch(self, entries: List[Dict[str, Any]], batch: List[RawEvent]) -> None:
+        """
+        Submit a batch to the parser pool, waiting for earlier batches first
+        when too many are in flight.
+
+        Args:
+            entries: Journal entries of the batch.
+            batch: Raw events to parse, one per entry.
+        """
+        self._swap_parser_pool()
+        self._pending.append((self.parser_pool.submit(_parse_batch_in_worker, batch), entries, batch))
+        if len(self._pending) > self.parser_workers * 2:
+            self._collect_parsed(block=True)
+    
+    def _collect_parsed(self, block: bool) -> None:
+        """
+        Pass finished parser results to the callback, in submission order.
+
+        Args:
+            block: Wait for the oldest batch even if it is not done yet.
+        """
+        while self._pending and (block or self._pending[0][0].done()):
+            future, entries, batch = self._pending.popleft()
+            block = False
+            try:
+                parsed = future.result()
+            except Exception as e:
+                self.logger.error("Parser pool batch failed: %s", e)
+                continue
+            for position, ip_address in parsed:
+                identifier, _, timestamp = batch[position]
+                # Same details as inline parsing stores
+                details = str(entries[position])
+                with tracer.trace('event', ip=ip_address, source=identifier) as trace:
+                    if trace is not None:
+                        trace.attrs['journal_lag'] = datetime.now() - timestamp
+                    self.event_callback(ip_address, timestamp, details)
+    
+    @staticmethod
+    def _entry_timestamp(entry: Dict[str, Any]) -> datetime:
+        """
+        Get the source timestamp of a journal entry, or now if it has none.
 
         Args:
             entry: A journal entry dictionary.
         """
+        if '_SOURCE_REALTIME_TIMESTAMP' in entry:
+            raw_timestamp = entry['_SOURCE_REALTIME_TIMESTAMP']
+            if isinstance(raw_timestamp, (int, float)):
+                return datetime.fromtimestamp(raw_timestamp / 1_000_000)
+            elif isinstance(raw_timestamp, datetime):
+                return raw_timestamp
+        return datetime.now()
+    
+    def _to_raw_event(self, entry: Dict[str, Any]) -> Optional[RawEvent]:
+        """
+        Reduce a journal entry to the fields the parsers need.
+
+        Args:
+            entry: A journal entry dictionary.
+
+        Returns:
+            (identifier, message, timestamp), or None if the entry has no message.
+        """
         if 'MESSAGE' not in entry:
-            return
+            return None
         
         message = entry['MESSAGE']
         if isinstance(message, bytes):
             message = message.decode('utf-8', errors='ignore')
         
-        # Check if the log message contains any of the configured keywords.
-        is_failed_attempt = any(keyword in message for keyword in self.config['monitoring']['keywords'])
+        identifier = entry.get('SYSLOG_IDENTIFIER', '')
+        return identifier, message, self._entry_timestamp(entry)
+    
+    def _process_entry(self, entry: Dict[str, Any]) -> None:
+        """
+        Process a journal entry to check for failed login attempts.
+
+        Args:
+            entry: A journal entry dictionary.
+        """
+        parse_start = time.monotonic()
+        raw_event = self._to_raw_event(entry)
+        if raw_event is None:
+            return
         
-        if is_failed_attempt:
-            ip_match = self.IP_REGEX.search(message)
-            if ip_match:
-                ip_address = ip_match.group(0)
-                
-                # Process the timestamp safely.
-                if '_SOURCE_REALTIME_TIMESTAMP' in entry:
-                    raw_timestamp = entry['_SOURCE_REALTIME_TIMESTAMP']
-                    if isinstance(raw_timestamp, (int, float)):
-                        timestamp = datetime.fromtimestamp(raw_timestamp / 1_000_000)
-                    elif isinstance(raw_timestamp, datetime):
-                        timestamp = raw_timestamp
-                    else:
-                        timestamp = datetime.now()
-                else:
-                    timestamp = datetime.now()
-                
-                details = str(entry)
-                self.event_callback(ip_address, timestamp, details)
+        identifier, message, timestamp = raw_event
+        
+        # Check if the log message contains any of the source's keywords.
+        matcher = self.matchers.get(identifier)
+        if matcher is None or matcher.search(message) is None:
+            return
+        
+        ip_match = IP_REGEX.search(message)
+        if ip_match:
+            details = str(entry)
+            with tracer.trace('event', start=parse_start, ip=ip_match.group(0), source=identifier) as trace:
+                if trace is not None:
+                    # Only sampled events pay for the clock read
+                    trace.attrs['journal_lag'] = datetime.now() - timestamp
+                    trace.spans.append(('parse', parse_start, time.monotonic()))
+                self.event_callback(ip_match.group(0), timestamp, details)
@@ -2,7 +2,111 @@ import threading
 import time
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, NamedTuple, Tuple
+
+from src.sketch import CountMinSketch, DistinctCounter
+from src.tracing import tracer
+
+
+class RuleParams(NamedTuple):
+    """
+    Rule parameters read from config, swapped as one object on reload.
+    """
+    threshold: int
+    time_window: int
+    block_duration_minutes: int
+    block_duration_multiplier: float
+    max_block_duration_minutes: int
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "RuleParams":
+        return cls(
+            threshold=config["rules"]["threshold"],
+            time_window=config["rules"]["time_window"],
+            block_duration_minutes=config["firewall"]["block_duration"],
+            block_duration_multiplier=config["firewall"]["block_duration_multiplier"],
+            max_block_duration_minutes=config["firewall"]["max_block_duration"],
+        )
+
+
+class StormTracker:
+    """
+    Tracks the distinct-IP rate and switches between exact and storm mode.
+    In storm mode per-IP attempt counts come from a fixed-size, time-decayed
+    Count-Min Sketch instead of a database query per attempt.
+    """
+    def __init__(self, storm_config: Dict[str, Any], time_window_minutes: int):
+        """
+        Initialize StormTracker
+
+        Args:
+            storm_config: The rules.storm section of config.yaml
+            time_window_minutes: Window the sketch counts attempts over
+        """
+        self.enter_rate = storm_config.get("enter_rate", 3000)
+        self.exit_rate = storm_config.get("exit_rate", self.enter_rate // 2)
+        self.check_interval = storm_config.get("check_interval", 10)
+
+        self.sketch = CountMinSketch(
+            width=storm_config.get("sketch_width", 16384),
+            depth=storm_config.get("sketch_depth", 4),
+            buckets=storm_config.get("sketch_buckets", 6),
+            window_seconds=time_window_minutes * 60,
+        )
+        self.distinct = DistinctCounter(storm_config.get("distinct_bits", 1 << 20))
+        self.active = False
+
+        self.log = logging.getLogger("autoshield")
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+
+    def observe(self, ip: str) -> int:
+        """
+        Count an attempt from ip.
+
+        Args:
+            ip: The IP address that made the failed attempt.
+
+        Returns:
+            Estimated attempts from ip within the time window.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.distinct.add(ip)
+            estimate = self.sketch.add(ip, now)
+            if now - self._window_start >= self.check_interval:
+                self._update_mode(now)
+        return estimate
+
+    def poll(self) -> None:
+        """
+        Re-evaluate the mode when no attempts arrive to do it.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_start >= self.check_interval:
+                self._update_mode(now)
+
+    def _update_mode(self, now: float) -> None:
+        """
+        Compute the distinct-IP rate of the finished check interval and
+        switch modes if it crossed the enter/exit rates.
+        """
+        rate = self.distinct.estimate() * 60 / (now - self._window_start)
+        self.distinct.reset()
+        self._window_start = now
+
+        if not self.active and rate >= self.enter_rate:
+            self.active = True
+            self.log.warning(
+                "Entering storm mode: ~%d distinct IPs/min (enter rate %d)", rate, self.enter_rate
+            )
+        elif self.active and rate < self.exit_rate:
+            self.active = False
+            self.log.warning(
+                "Leaving storm mode: ~%d distinct IPs/min (exit rate %d)", rate, self.exit_rate
+            )
+
 
 class RuleEngine:
     """
@@ -26,12 +130,8 @@ class RuleEngine:
 
         self.log = logging.getLogger("autoshield")
 
-        self.threshold = config["rules"]["threshold"]
-        self.time_window = config["rules"]["time_window"]
-
-        self.block_duration_minutes = config["firewall"]["block_duration"]
-        self.block_duration_multiplier = config["firewall"]["block_duration_multiplier"]
-        self.max_block_duration_minutes = config["firewall"]["max_block_duration"]
+        self.params = RuleParams.from_config(config)
+        self.storm = self._create_storm_tracker(config)
 
         self._stop_event = threading.Event()
         self._thread = threading.Thread(target=self._background_expiry_check, daemon=True)
@@ -51,6 +151,49 @@ class RuleEngine:
         self._stop_event.set()
         self._thread.join()
 
+    def prepare_reload(self, config: Dict[str, Any]) -> Tuple[RuleParams, Optional[StormTracker]]:
+        """
+        Build everything a reload needs without changing the engine, so a
+        bad config raises before anything is swapped.
+
+        Args:
+            config: Dictionary loaded from config.yaml
+
+        Returns:
+            (params, storm tracker) to pass to reload_config
+        """
+        params = RuleParams.from_config(config)
+        storm = self.storm
+        if (config["rules"].get("storm") != self.config["rules"].get("storm")
+                or params.time_window != self.params.time_window):
+            storm = self._create_storm_tracker(config)
+        return params, storm
+
+    def reload_config(self, config: Dict[str, Any],
+                      prepared: Optional[Tuple[RuleParams, Optional[StormTracker]]] = None) -> None:
+        """
+        Swap in rule parameters from a new config. Attempts already in
+        progress finish with the parameters they started with.
+
+        Args:
+            config: Dictionary loaded from config.yaml
+            prepared: Result of prepare_reload(config), built here if None
+        """
+        params, storm = prepared if prepared is not None else self.prepare_reload(config)
+        self.storm = storm
+        self.params = params
+        self.config = config
+        self.log.info("RuleEngine parameters reloaded: %s", self.params)
+
+    def _create_storm_tracker(self, config: Dict[str, Any]) -> Optional[StormTracker]:
+        """
+        Build the storm tracker if rules.storm is enabled in config.
+        """
+        storm_config = config["rules"].get("storm") or {}
+        if not storm_config.get("enabled", False):
+            return None
+        return StormTracker(storm_config, config["rules"]["time_window"])
+
     def process_attempt(self, ip: str, timestamp: datetime, details: str) -> None:
         """
         Process a single failed attempt. If the IP exceeds the threshold,
@@ -61,33 +204,51 @@ class RuleEngine:
             timestamp: The datetime of the failed attempt.
             details: Additional details (log entry, etc.).
         """
-        self.logger.log_attempt(ip, timestamp, details)
+        params = self.params
+        storm = self.storm
+        with tracer.span("storm.observe"):
+            estimate = storm.observe(ip) if storm is not None else 0
+        in_storm = storm is not None and storm.active
 
-        recent_attempts = self.logger.get_recent_attempts(ip, self.time_window)
+        with tracer.span("log_attempt"):
+            self.logger.log_attempt(ip, timestamp, details, log_to_file=not in_storm)
+
+        # In storm mode only IPs the sketch puts over the threshold are checked exactly
+        if in_storm and estimate < params.threshold:
+            return
+
+        with tracer.span("recent_attempts"):
+            recent_attempts = self.logger.get_recent_attempts(ip, params.time_window)
         attempt_count = len(recent_attempts)
 
-        if attempt_count >= self.threshold:
+        if attempt_count >= params.threshold:
 
-            block_count, last_block_time, last_expiry = self.logger.get_block_history(ip)
+            with tracer.span("block_history"):
+                block_count, last_block_time, last_expiry = self.logger.get_block_history(ip)
 
             if block_count == 0 or (last_expiry and last_expiry < datetime.now()):
 
-                new_block_duration = self._calculate_block_duration(block_count)
+                new_block_duration = self._calculate_block_duration(block_count, params)
                 block_start = datetime.now()
                 block_end = block_start + timedelta(minutes=new_block_duration)
 
-                blocked = self.firewall.block_ip(ip)
+                with tracer.span("firewall.block_ip"):
+                    blocked = self.firewall.block_ip(ip)
                 if blocked:
-                    self.logger.log_block(ip, block_start, block_end)
+                    tracer.annotate(blocked=True)
+                    with tracer.span("log_block"):
+                        self.logger.log_block(ip, block_start, block_end)
 
-    def _calculate_block_duration(self, block_count: int) -> int:
+    def _calculate_block_duration(self, block_count: int, params: Optional[RuleParams] = None) -> int:
         """
         Given how many times an IP has been blocked previously,
         compute how long the new block should be (in minutes).
         """
-        base = self.block_duration_minutes
-        multi = self.block_duration_multiplier
-        max_dur = self.max_block_duration_minutes
+        if params is None:
+            params = self.params
+        base = params.block_duration_minutes
+        multi = params.block_duration_multiplier
+        max_dur = params.max_block_duration_minutes
 
         # Duration = base * (multi^(block_count)) 
         
@@ -108,13 +269,17 @@ class RuleEngine:
                 active_blocks = self.logger.get_active_blocks()
                 now = datetime.now()
 
-                for ip, expiry_timestamp in active_blocks:
-                    if now >= expiry_timestamp:
-                        unblocked = self.firewall.unblock_ip(ip)
-                        if unblocked:
-                            self.logger.log_unblock(ip, now)
+                # One chain listing for all expired IPs, most of which are long gone from it
+                expired = [ip for ip, expiry_timestamp in active_blocks if now >= expiry_timestamp]
+                if expired:
+                    for ip in self.firewall.unblock_ips(expired):
+                        self.logger.log_unblock(ip, now)
+
+                self.logger.flush_attempt_summary()
+                if self.storm is not None:
+                    self.storm.poll()
             except Exception as e:
-                self.log.error(f"Error during block expiry check: {e}")
+                self.log.error("Error during block expiry check: %s", e)
 
 
             self._stop_event.wait(10) #check every 10 seconds 
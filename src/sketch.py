@@ -0,0 +1,120 @@
+import math
+import time
+from array import array
+from typing import List, Optional
+
+class CountMinSketch:
+    """
+    Count-Min Sketch over a sliding time window.
+
+    The window is split into buckets, each holding its own depth x width
+    counter table, plus one extra bucket for the part of the oldest bucket
+    still inside the window. Counts are dropped a bucket at a time once
+    they are older than the window, so memory stays fixed no matter how many
+    keys are seen. Estimates cover at least the full window and never
+    undercount; they overcount on hash collisions and by up to one bucket
+    of counts just older than the window.
+    """
+    def __init__(self, width: int, depth: int, buckets: int, window_seconds: float):
+        """
+        Initialize the sketch
+
+        Args:
+            width: Counters per row
+            depth: Number of rows (independent hashes)
+            buckets: Number of time buckets the window is split into
+            window_seconds: Length of the sliding window
+        """
+        if width <= 0 or depth <= 0 or buckets <= 0:
+            raise ValueError("Sketch width, depth and buckets must be positive")
+        if window_seconds <= 0:
+            raise ValueError("Sketch window must be positive")
+        self.width = width
+        self.depth = depth
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        # The current slot is cleared when entered, so one more than the
+        # window's buckets keeps counts for the whole window
+        self._slots = buckets + 1
+        self._tables: List[array] = [array('I', bytes(4 * width * depth)) for _ in range(self._slots)]
+        self._current_slot = self._slot(time.monotonic())
+
+    def _slot(self, now: float) -> int:
+        return int(now / self.bucket_seconds)
+
+    def _advance(self, now: float) -> None:
+        """
+        Clear the buckets that have fallen out of the window since the last call
+        """
+        slot = self._slot(now)
+        stale = min(slot - self._current_slot, self._slots)
+        for offset in range(1, stale + 1):
+            self._tables[(self._current_slot + offset) % self._slots] = array('I', bytes(4 * self.width * self.depth))
+        self._current_slot = max(slot, self._current_slot)
+
+    def _indexes(self, key: str) -> List[int]:
+        return [row * self.width + hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key: str, now: Optional[float] = None) -> int:
+        """
+        Count one occurrence of key
+
+        Args:
+            key: The key to count
+            now: Monotonic time, defaults to time.monotonic()
+
+        Returns:
+            Estimated count for key within the window, including this one
+        """
+        self._advance(time.monotonic() if now is None else now)
+        indexes = self._indexes(key)
+        table = self._tables[self._current_slot % self._slots]
+        for index in indexes:
+            table[index] += 1
+        return min(sum(t[index] for t in self._tables) for index in indexes)
+
+    def estimate(self, key: str, now: Optional[float] = None) -> int:
+        """
+        Estimated count for key within the window
+        """
+        self._advance(time.monotonic() if now is None else now)
+        indexes = self._indexes(key)
+        return min(sum(t[index] for t in self._tables) for index in indexes)
+
+class DistinctCounter:
+    """
+    Fixed-size linear counter estimating the number of distinct keys seen
+    since the last reset.
+    """
+    def __init__(self, bits: int):
+        """
+        Initialize the counter
+
+        Args:
+            bits: Size of the bitmap, the estimate degrades as it fills up
+        """
+        if bits < 8:
+            raise ValueError("Distinct counter needs at least 8 bits")
+        self.bits = bits
+        self._bitmap = bytearray(bits // 8)
+        self._zeros = (bits // 8) * 8
+
+    def add(self, key: str) -> None:
+        position = hash(key) % (len(self._bitmap) * 8)
+        byte, mask = position >> 3, 1 << (position & 7)
+        if not self._bitmap[byte] & mask:
+            self._bitmap[byte] |= mask
+            self._zeros -= 1
+
+    def estimate(self) -> int:
+        """
+        Estimated number of distinct keys added since the last reset
+        """
+        size = len(self._bitmap) * 8
+        if self._zeros == 0:
+            return int(size * math.log(size))
+        return int(-size * math.log(self._zeros / size))
+
+    def reset(self) -> None:
+        self._bitmap = bytearray(len(self._bitmap))
+        self._zeros = len(self._bitmap) * 8
@@ -0,0 +1,142 @@
+import os
+import sys
+import zlib
+import struct
+import socket
+import logging
+import argparse
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+# Snapshot layout: header, then a zlib-compressed run of fixed-size records
+# sorted by packed address.
+MAGIC = b'ASNP'
+VERSION = 1
+HEADER = struct.Struct('!4sBI')  # magic, version, record count
+RECORD = struct.Struct('!4sII')  # packed IPv4, expiry (epoch seconds), block count
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot cannot be read
+    """
+
+def encode_snapshot(offenders: List[Tuple[str, datetime, int]]) -> bytes:
+    """
+    Encode offenders as a compact snapshot
+
+    Args:
+        offenders: List of (ip, expiry_timestamp, block_count) tuples
+
+    Returns:
+        Snapshot bytes
+    """
+    records = []
+    for ip, expiry, count in offenders:
+        try:
+            packed_ip = socket.inet_aton(ip)
+        except OSError:
+            logging.getLogger('autoshield').warning("Skipping non-IPv4 address %s in snapshot", ip)
+            continue
+        records.append(RECORD.pack(packed_ip, max(int(expiry.timestamp()), 0), count))
+    records.sort()
+
+    return HEADER.pack(MAGIC, VERSION, len(records)) + zlib.compress(b''.join(records), 9)
+
+def decode_snapshot(data: bytes) -> List[Tuple[str, datetime, int]]:
+    """
+    Decode a snapshot
+
+    Args:
+        data: Snapshot bytes
+
+    Returns:
+        List of (ip, expiry_timestamp, block_count) tuples
+    """
+    if len(data) < HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version, count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("Not an AutoShield snapshot")
+    if version != VERSION:
+        raise SnapshotError(f"Unsupported snapshot version {version}")
+
+    try:
+        payload = zlib.decompress(data[HEADER.size:])
+    except zlib.error as e:
+        raise SnapshotError(f"Corrupt snapshot: {e}")
+    if len(payload) != count * RECORD.size:
+        raise SnapshotError("Snapshot record count does not match its contents")
+
+    return [
+        (socket.inet_ntoa(packed_ip), datetime.fromtimestamp(expiry), block_count)
+        for packed_ip, expiry, block_count in RECORD.iter_unpack(payload)
+    ]
+
+def export_snapshot(logger: Any) -> bytes:
+    """
+    Export the blocklist and offender counts from the database
+
+    Args:
+        logger: Logger instance
+
+    Returns:
+        Snapshot bytes
+    """
+    return encode_snapshot(logger.get_offenders())
+
+def import_snapshot(data: bytes, logger: Any, firewall: Any) -> Tuple[int, int]:
+    """
+    Merge a snapshot into the database and block the IPs whose block is
+    active afterwards. See Logger.merge_offenders for how records merge.
+
+    Args:
+        data: Snapshot bytes
+        logger: Logger instance
+        firewall: Firewall instance
+
+    Returns:
+        (records imported, IPs blocked)
+    """
+    offenders = decode_snapshot(data)
+    active = logger.merge_offenders(offenders)
+    blocked = firewall.block_ips(active)
+    return len(offenders), len(blocked)
+
+def main() -> None:
+    """
+    Command line entry point for exporting and importing snapshots
+    """
+    parser = argparse.ArgumentParser(description="Export or import an AutoShield blocklist snapshot")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('export', help="Write a snapshot").add_argument('path')
+    subparsers.add_parser('import', help="Load a snapshot").add_argument('path')
+    args = parser.parse_args()
+
+    from src.main import load_config
+    from src.logger import Logger
+    from src.firewall import Firewall
+
+    default_config_path = Path(__file__).resolve().parent.parent / 'config' / 'config.yaml'
+    config = load_config(os.environ.get('AUTOSHIELD_CONFIG', default_config_path))
+    logger = Logger(config)
+
+    try:
+        if args.command == 'export':
+            data = export_snapshot(logger)
+            with open(args.path, 'wb') as f:
+                f.write(data)
+            print(f"Wrote {len(data)} bytes to {args.path}")
+        else:
+            with open(args.path, 'rb') as f:
+                data = f.read()
+            records, blocked = import_snapshot(data, logger, Firewall(config, logger))
+            print(f"Imported {records} records, blocked {blocked} IPs")
+    except (OSError, SnapshotError) as e:
+        print(f"Snapshot {args.command} failed: {e}")
+        sys.exit(1)
+    finally:
+        logger.close()
+
+if __name__ == "__main__":
+    main()
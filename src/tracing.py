@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import heapq
+import random
+import itertools
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+class Trace:
+    """
+    Timing of one event through the pipeline, as monotonic-clock spans
+    """
+    def __init__(self, name: str, attrs: Dict[str, Any], start: Optional[float] = None):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.monotonic() if start is None else start
+        self.end: Optional[float] = None
+        self.spans: List[Tuple[str, float, float]] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.monotonic()) - self.start
+
+class _NoopScope:
+    """
+    Returned when there is nothing to trace, so untraced events only pay
+    for an attribute lookup
+    """
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        return False
+
+_NOOP = _NoopScope()
+
+class _SpanScope:
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.start = time.monotonic()
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        self.trace.spans.append((self.name, self.start, time.monotonic()))
+        return False
+
+class _TraceScope:
+    def __init__(self, tracer: "Tracer", trace: Trace):
+        self.tracer = tracer
+        self.trace = trace
+
+    def __enter__(self) -> Trace:
+        self.tracer._local.current = self.trace
+        return self.trace
+
+    def __exit__(self, *exc_info: Any) -> bool:
+        self.trace.end = time.monotonic()
+        self.tracer._local.current = None
+        self.tracer._record(self.trace)
+        return False
+
+class Tracer:
+    """
+    Samples events, times their spans and keeps the slowest traces.
+
+    The trace of the event being processed is kept per thread, so code
+    further down the pipeline only needs tracer.span() and never has to be
+    passed the trace.
+    """
+    def __init__(self, sample_rate: float = 0.0, slowest: int = 50):
+        """
+        Initialize the tracer
+
+        Args:
+            sample_rate: Fraction of events to trace, 0 disables tracing
+            slowest: Number of slowest traces to keep
+        """
+        self.sample_rate = sample_rate
+        self.slowest = slowest
+        self.dump_path: Optional[str] = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, Trace]] = []
+        self._sequence = itertools.count()
+
+    def configure(self, config: Dict[str, Any]) -> None:
+        """
+        Apply the tracing section of config.yaml
+
+        Args:
+            config: Config dict from config.yaml
+        """
+        tracing = config.get('tracing') or {}
+        self.sample_rate = tracing.get('sample_rate', 0.0)
+        self.dump_path = tracing.get('dump_path')
+        with self._lock:
+            self.slowest = tracing.get('slowest', 50)
+            while len(self._heap) > self.slowest:
+                heapq.heappop(self._heap)
+
+    def trace(self, name: str, start: Optional[float] = None, **attrs: Any) -> Any:
+        """
+        Start tracing an event, if it is sampled
+
+        Args:
+            name: Name of the event
+            start: Monotonic time the event started, defaults to now
+            attrs: Extra values stored with the trace
+
+        Returns:
+            Context manager yielding the Trace, or None when not sampled
+        """
+        if self.sample_rate <= 0 or getattr(self._local, 'current', None) is not None:
+            return _NOOP
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return _NOOP
+        return _TraceScope(self, Trace(name, attrs, start))
+
+    def span(self, name: str) -> Any:
+        """
+        Time a step of the event traced in this thread, if any
+
+        Args:
+            name: Name of the step
+
+        Returns:
+            Context manager
+        """
+        current = getattr(self._local, 'current', None)
+        if current is None:
+            return _NOOP
+        return _SpanScope(current, name)
+
+    def annotate(self, **attrs: Any) -> None:
+        """
+        Add values to the trace of this thread, if any
+        """
+        current = getattr(self._local, 'current', None)
+        if current is not None:
+            current.attrs.update(attrs)
+
+    def _record(self, trace: Trace) -> None:
+        with self._lock:
+            entry = (trace.duration, next(self._sequence), trace)
+            if len(self._heap) < self.slowest:
+                heapq.heappush(self._heap, entry)
+            elif self._heap and entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def slowest_traces(self) -> List[Trace]:
+        """
+        Get the kept traces, slowest first
+        """
+        with self._lock:
+            return [trace for _, _, trace in sorted(self._heap, key=lambda entry: entry[0], reverse=True)]
+
+    def to_trace_events(self) -> Dict[str, Any]:
+        """
+        Export the slowest traces in trace-event JSON format, one row per trace
+
+        Returns:
+            Dict ready for json.dump
+        """
+        events = []
+        pid = os.getpid()
+        for row, trace in enumerate(self.slowest_traces()):
+            events.append({
+                'name': trace.name, 'ph': 'X', 'pid': pid, 'tid': row,
+                'ts': trace.start * 1e6, 'dur': trace.duration * 1e6,
+                'args': {key: str(value) for key, value in trace.attrs.items()},
+            })
+            for name, start, end in trace.spans:
+                events.append({
+                    'name': name, 'ph': 'X', 'pid': pid, 'tid': row,
+                    'ts': start * 1e6, 'dur': (end - start) * 1e6,
+                })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def dump(self, path: Optional[str] = None) -> str:
+        """
+        Write the slowest traces to a trace-event JSON file
+
+        Args:
+            path: File to write, defaults to tracing.dump_path
+
+        Returns:
+            The path written
+        """
+        path = path or self.dump_path
+        if not path:
+            raise ValueError("No trace dump path configured")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_trace_events(), f)
+        os.replace(tmp_path, path)
+        return path
+
+# Shared by the daemon components
+tracer = Tracer()
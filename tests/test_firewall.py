@@ -0,0 +1,180 @@
+import json
+import unittest
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.firewall import (
+    FirewallBackend, JsonBackend, MemoryBackend, Firewall, FirewallError, RULE, SET,
+)
+
+# Output of `nft -a -j list chain inet autoshield input` as left by versions
+# that added one rule per IP: two blocked IPs, a prefix block, an accept
+# rule and an unrelated drop rule
+LEGACY_CHAIN_OUTPUT = json.loads('''
+{"nftables": [
+  {"metainfo": {"version": "1.0.6", "release_name": "Lester Gooch #5", "json_schema_version": 1}},
+  {"chain": {"family": "inet", "table": "autoshield", "name": "input", "handle": 1,
+             "type": "filter", "hook": "input", "prio": 0, "policy": "accept"}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 4,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "ip", "field": "saddr"}}, "right": "203.0.113.7"}},
+              {"counter": {"packets": 12, "bytes": 720}},
+              {"drop": null}]}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 5,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "ip", "field": "saddr"}}, "right": "198.51.100.23"}},
+              {"counter": {"packets": 0, "bytes": 0}},
+              {"drop": null}]}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 6,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "ip", "field": "saddr"}},
+                         "right": {"prefix": {"addr": "192.0.2.0", "len": 24}}}},
+              {"drop": null}]}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 7,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "ip", "field": "saddr"}}, "right": "10.0.0.1"}},
+              {"accept": null}]}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 8,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "tcp", "field": "dport"}}, "right": 23}},
+              {"drop": null}]}}
+]}
+''')['nftables']
+
+# Output of `nft -a -j list chain inet autoshield input` with the blocklist rule
+SET_CHAIN_OUTPUT = json.loads('''
+{"nftables": [
+  {"metainfo": {"version": "1.0.6", "release_name": "Lester Gooch #5", "json_schema_version": 1}},
+  {"chain": {"family": "inet", "table": "autoshield", "name": "input", "handle": 1,
+             "type": "filter", "hook": "input", "prio": 0, "policy": "accept"}},
+  {"rule": {"family": "inet", "table": "autoshield", "chain": "input", "handle": 3,
+            "expr": [
+              {"match": {"op": "==", "left": {"payload": {"protocol": "ip", "field": "saddr"}}, "right": "@blocklist"}},
+              {"counter": {"packets": 3, "bytes": 180}},
+              {"drop": null}]}}
+]}
+''')['nftables']
+
+# Output of `nft -j list set inet autoshield blocklist`
+LIST_SET_OUTPUT = json.loads('''
+{"nftables": [
+  {"metainfo": {"version": "1.0.6", "release_name": "Lester Gooch #5", "json_schema_version": 1}},
+  {"set": {"family": "inet", "name": "blocklist", "table": "autoshield", "type": "ipv4_addr", "handle": 2,
+           "elem": ["198.51.100.23", "203.0.113.7", {"elem": {"val": "192.0.2.9", "counter": {"packets": 1, "bytes": 60}}}]}}
+]}
+''')['nftables']
+
+class CannedBackend(JsonBackend):
+    """
+    Records the commands it is given, answers list commands with canned
+    output and raises the given error for the given command
+    """
+    def __init__(self, output: Dict[str, List[Dict[str, Any]]], fail: Optional[Dict[Tuple[str, str], str]] = None):
+        self.output = output
+        self.fail = fail or {}
+        self.commands: List[List[Dict[str, Any]]] = []
+
+    def _json_cmd(self, commands: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        verb, target = next(iter(commands[0].items()))
+        kind = next(iter(target))
+        if (verb, kind) in self.fail:
+            raise FirewallError(self.fail[(verb, kind)])
+        self.commands.append(commands)
+        if verb == 'list':
+            return self.output.get(kind, [])
+        return []
+
+class JsonBackendTest(unittest.TestCase):
+    def test_backends_are_abstract(self):
+        with self.assertRaises(TypeError):
+            FirewallBackend()
+        with self.assertRaises(TypeError):
+            JsonBackend()
+
+    def test_list_blocked_reads_set_elements(self):
+        backend = CannedBackend({'set': LIST_SET_OUTPUT})
+        self.assertEqual(backend.list_blocked(), {'198.51.100.23', '203.0.113.7', '192.0.2.9'})
+        self.assertEqual(backend.commands, [[{'list': {'set': SET}}]])
+
+    def test_list_blocked_empty_set(self):
+        backend = CannedBackend({'set': [{'set': dict(SET, type='ipv4_addr', handle=2)}]})
+        self.assertEqual(backend.list_blocked(), set())
+
+    def test_add_blocks_is_one_element_update(self):
+        backend = CannedBackend({})
+        backend.add_blocks(['203.0.113.7', '198.51.100.23'])
+        backend.add_blocks([])
+        self.assertEqual(backend.commands, [[
+            {'add': {'element': dict(SET, elem=['203.0.113.7', '198.51.100.23'])}},
+        ]])
+
+    def test_add_block_reports_existing_element(self):
+        backend = CannedBackend({})
+        self.assertTrue(backend.add_block('203.0.113.7'))
+        self.assertEqual(backend.commands, [[{'create': {'element': dict(SET, elem=['203.0.113.7'])}}]])
+
+        backend.fail[('create', 'element')] = "Error: Could not process rule: File exists"
+        self.assertFalse(backend.add_block('203.0.113.7'))
+        backend.fail[('create', 'element')] = "Error: Could not process rule: No such file or directory"
+        with self.assertRaises(FirewallError):
+            backend.add_block('203.0.113.7')
+
+    def test_remove_blocks_is_one_element_update(self):
+        backend = CannedBackend({})
+        backend.remove_blocks(['203.0.113.7', '198.51.100.23'])
+        self.assertEqual(backend.commands, [[
+            {'delete': {'element': dict(SET, elem=['203.0.113.7', '198.51.100.23'])}},
+        ]])
+
+    def test_ensure_table_creates_missing_table(self):
+        backend = CannedBackend({}, fail={('list', 'chain'): "No such file or directory"})
+        self.assertTrue(backend.ensure_table())
+        commands, = backend.commands
+        self.assertEqual([next(iter(command['add'])) for command in commands], ['table', 'chain', 'set', 'rule'])
+        rule = commands[-1]['add']['rule']
+        self.assertEqual(JsonBackend._rule_target(rule), '@blocklist')
+
+    def test_ensure_table_keeps_existing_blocklist(self):
+        backend = CannedBackend({'chain': SET_CHAIN_OUTPUT})
+        self.assertFalse(backend.ensure_table())
+        self.assertEqual(len(backend.commands), 1)
+
+    def test_ensure_table_moves_per_ip_rules_into_the_set(self):
+        backend = CannedBackend({'chain': LEGACY_CHAIN_OUTPUT})
+        self.assertTrue(backend.ensure_table())
+        _, commands = backend.commands
+        self.assertEqual(commands[0], {'add': {'set': dict(SET, type='ipv4_addr')}})
+        self.assertIn('rule', commands[1]['add'])
+        # Only single-IP drop rules move; prefix, accept and port rules stay
+        self.assertEqual(commands[2], {'add': {'element': dict(SET, elem=['203.0.113.7', '198.51.100.23'])}})
+        self.assertEqual(commands[3:], [
+            {'delete': {'rule': dict(RULE, handle=4)}},
+            {'delete': {'rule': dict(RULE, handle=5)}},
+        ])
+
+class FirewallTest(unittest.TestCase):
+    def setUp(self):
+        config = {'firewall': {'whitelist': ['10.0.0.1']}}
+        self.backend = MemoryBackend()
+        self.firewall = Firewall(config, None, backend=self.backend)
+
+    def test_block_ip_skips_whitelisted_and_already_blocked(self):
+        self.assertTrue(self.firewall.block_ip('203.0.113.7'))
+        self.assertFalse(self.firewall.block_ip('203.0.113.7'))
+        self.assertFalse(self.firewall.block_ip('10.0.0.1'))
+        self.assertEqual(self.firewall.get_blocked_ips(), ['203.0.113.7'])
+
+    def test_block_ips_skips_whitelisted_and_already_blocked(self):
+        self.assertTrue(self.firewall.block_ip('203.0.113.7'))
+        blocked = self.firewall.block_ips(['203.0.113.7', '10.0.0.1', '198.51.100.23', '198.51.100.23'])
+        self.assertEqual(blocked, ['198.51.100.23'])
+        self.assertEqual(sorted(self.firewall.get_blocked_ips()), ['198.51.100.23', '203.0.113.7'])
+
+    def test_unblock_ips_only_removes_blocked(self):
+        self.firewall.block_ips(['203.0.113.7', '198.51.100.23'])
+        self.assertEqual(self.firewall.unblock_ips(['203.0.113.7', '192.0.2.1']), ['203.0.113.7'])
+        self.assertFalse(self.firewall.unblock_ip('203.0.113.7'))
+        self.assertTrue(self.firewall.unblock_ip('198.51.100.23'))
+        self.assertEqual(self.firewall.get_blocked_ips(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from src.logger import Logger
+
+class LoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir)
+
+    def make_logger(self, name):
+        return Logger({
+            'logging': {'file_path': os.path.join(self.work_dir, f'{name}.log'), 'level': 'INFO', 'console': False},
+            'database': {'path': os.path.join(self.work_dir, f'{name}.db')},
+        })
+
+    def read_log(self, name):
+        with open(os.path.join(self.work_dir, f'{name}.log')) as f:
+            return f.read()
+
+    def test_close_detaches_queue_handler(self):
+        root_handlers = list(logging.getLogger().handlers)
+        first = self.make_logger('first')
+        first.close()
+        self.assertEqual(logging.getLogger().handlers, root_handlers)
+
+        # A later logger's records reach its own file only
+        second = self.make_logger('second')
+        logging.getLogger('autoshield').info("after first closed")
+        second.close()
+        self.assertIn("after first closed", self.read_log('second'))
+        self.assertNotIn("after first closed", self.read_log('first'))
+
+if __name__ == '__main__':
+    unittest.main()
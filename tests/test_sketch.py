@@ -0,0 +1,45 @@
+import unittest
+
+from src.sketch import CountMinSketch, DistinctCounter
+
+class CountMinSketchTest(unittest.TestCase):
+    def test_counts_cover_the_whole_window(self):
+        sketch = CountMinSketch(width=64, depth=4, buckets=6, window_seconds=120)
+        start = 1000 * sketch.bucket_seconds
+        self.assertEqual(sketch.add('203.0.113.7', now=start + 19), 1)
+        # Just under the window later, in the slot that wraps onto the first one
+        self.assertEqual(sketch.add('203.0.113.7', now=start + 19 + 119), 2)
+
+    def test_counts_expire_after_window_and_one_bucket(self):
+        sketch = CountMinSketch(width=64, depth=4, buckets=6, window_seconds=120)
+        start = 1000 * sketch.bucket_seconds
+        sketch.add('203.0.113.7', now=start)
+        self.assertEqual(sketch.estimate('203.0.113.7', now=start + 139), 1)
+        self.assertEqual(sketch.estimate('203.0.113.7', now=start + 140), 0)
+
+    def test_keys_are_counted_separately(self):
+        sketch = CountMinSketch(width=1024, depth=4, buckets=6, window_seconds=120)
+        for _ in range(5):
+            sketch.add('203.0.113.7', now=0)
+        sketch.add('198.51.100.23', now=0)
+        self.assertEqual(sketch.estimate('203.0.113.7', now=0), 5)
+        self.assertEqual(sketch.estimate('198.51.100.23', now=0), 1)
+
+    def test_rejects_bad_sizes(self):
+        with self.assertRaises(ValueError):
+            CountMinSketch(width=0, depth=4, buckets=6, window_seconds=120)
+        with self.assertRaises(ValueError):
+            CountMinSketch(width=64, depth=4, buckets=6, window_seconds=0)
+
+class DistinctCounterTest(unittest.TestCase):
+    def test_estimate_and_reset(self):
+        counter = DistinctCounter(1 << 16)
+        for n in range(1000):
+            counter.add(f"10.0.{n >> 8}.{n & 255}")
+            counter.add(f"10.0.{n >> 8}.{n & 255}")
+        self.assertAlmostEqual(counter.estimate(), 1000, delta=50)
+        counter.reset()
+        self.assertEqual(counter.estimate(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
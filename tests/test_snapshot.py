@@ -0,0 +1,147 @@
+import os
+import zlib
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from src.logger import Logger
+from src.firewall import Firewall, MemoryBackend
+from src.snapshot import (
+    HEADER, MAGIC, VERSION, SnapshotError, encode_snapshot, decode_snapshot, export_snapshot, import_snapshot,
+)
+
+class SnapshotFormatTest(unittest.TestCase):
+    def test_round_trip(self):
+        expiry = datetime(2026, 10, 19, 12, 30, 15)
+        offenders = [('203.0.113.7', expiry, 3), ('10.0.0.1', expiry + timedelta(days=1), 1)]
+        decoded = decode_snapshot(encode_snapshot(offenders))
+        # Records come back sorted by address
+        self.assertEqual(decoded, sorted(offenders))
+
+    def test_expiry_is_truncated_to_seconds(self):
+        expiry = datetime(2026, 10, 19, 12, 30, 15, 999999)
+        (_, decoded_expiry, _), = decode_snapshot(encode_snapshot([('203.0.113.7', expiry, 1)]))
+        self.assertEqual(decoded_expiry, expiry.replace(microsecond=0))
+
+    def test_non_ipv4_addresses_are_skipped(self):
+        expiry = datetime(2026, 10, 19, 12, 30, 15)
+        decoded = decode_snapshot(encode_snapshot([('2001:db8::1', expiry, 1), ('203.0.113.7', expiry, 2)]))
+        self.assertEqual(decoded, [('203.0.113.7', expiry, 2)])
+
+    def test_empty_snapshot(self):
+        self.assertEqual(decode_snapshot(encode_snapshot([])), [])
+
+    def test_rejects_bad_snapshots(self):
+        data = encode_snapshot([('203.0.113.7', datetime(2026, 10, 19), 1)])
+        bad_snapshots = {
+            'truncated header': data[:HEADER.size - 1],
+            'wrong magic': b'XXXX' + data[4:],
+            'wrong version': HEADER.pack(MAGIC, VERSION + 1, 1) + data[HEADER.size:],
+            'corrupt payload': data[:HEADER.size] + b'not zlib',
+            'wrong count': HEADER.pack(MAGIC, VERSION, 2) + data[HEADER.size:],
+            'partial record': HEADER.pack(MAGIC, VERSION, 1) + zlib.compress(b'\x00' * 5),
+        }
+        for name, bad in bad_snapshots.items():
+            with self.subTest(name), self.assertRaises(SnapshotError):
+                decode_snapshot(bad)
+
+class MergeOffendersTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.logger = Logger({
+            'logging': {'file_path': os.path.join(self.work_dir, 'autoshield.log'), 'level': 'INFO', 'console': False},
+            'database': {'path': os.path.join(self.work_dir, 'database.db')},
+        })
+        self.firewall = Firewall({}, self.logger, backend=MemoryBackend())
+        self.now = datetime.now().replace(microsecond=0)
+
+    def tearDown(self):
+        self.logger.close()
+        shutil.rmtree(self.work_dir)
+
+    def block(self, ip, expiry, count):
+        with self.logger.conn:
+            self.logger.conn.execute(
+                'INSERT INTO blocks (ip, block_timestamp, expiry_timestamp, block_count) VALUES (?, ?, ?, ?)',
+                (ip, (self.now - timedelta(minutes=1)).isoformat(), expiry.isoformat(), count)
+            )
+
+    def rows(self):
+        return self.logger.conn.execute(
+            'SELECT ip, expiry_timestamp, block_count FROM blocks ORDER BY id'
+        ).fetchall()
+
+    def offenders(self):
+        return {ip: (expiry, count) for ip, expiry, count in self.logger.get_offenders()}
+
+    def test_later_expiry_wins(self):
+        self.block('203.0.113.7', self.now + timedelta(minutes=60), 1)
+        self.block('198.51.100.23', self.now + timedelta(minutes=60), 1)
+        active = self.logger.merge_offenders([
+            ('203.0.113.7', self.now + timedelta(minutes=5), 1),
+            ('198.51.100.23', self.now + timedelta(hours=5), 1),
+        ], now=self.now)
+
+        self.assertEqual(sorted(active), ['198.51.100.23', '203.0.113.7'])
+        offenders = self.offenders()
+        self.assertEqual(offenders['203.0.113.7'][0], self.now + timedelta(minutes=60))
+        self.assertEqual(offenders['198.51.100.23'][0], self.now + timedelta(hours=5))
+
+    def test_higher_count_wins(self):
+        self.block('203.0.113.7', self.now + timedelta(minutes=60), 4)
+        self.block('198.51.100.23', self.now + timedelta(minutes=60), 1)
+        self.logger.merge_offenders([
+            ('203.0.113.7', self.now + timedelta(minutes=5), 2),
+            ('198.51.100.23', self.now + timedelta(minutes=5), 6),
+        ], now=self.now)
+
+        offenders = self.offenders()
+        self.assertEqual(offenders['203.0.113.7'][1], 4)
+        self.assertEqual(offenders['198.51.100.23'][1], 6)
+        # Counts are raised in place rather than with new blocks
+        self.assertEqual(len(self.rows()), 2)
+
+    def test_expired_records(self):
+        self.block('203.0.113.7', self.now - timedelta(minutes=30), 1)
+        active = self.logger.merge_offenders([
+            ('203.0.113.7', self.now - timedelta(minutes=10), 3),
+            ('198.51.100.23', self.now - timedelta(days=1), 5),
+        ], now=self.now)
+
+        self.assertEqual(active, [])
+        # The known IP only gets the higher count, the unknown one is skipped
+        self.assertEqual(self.rows(), [('203.0.113.7', (self.now - timedelta(minutes=30)).isoformat(), 3)])
+
+    def test_reimport_adds_nothing(self):
+        data = encode_snapshot([
+            ('203.0.113.7', self.now + timedelta(hours=1), 2),
+            ('198.51.100.23', self.now - timedelta(hours=1), 1),
+        ])
+        self.assertEqual(import_snapshot(data, self.logger, self.firewall), (2, 1))
+        rows = self.rows()
+
+        self.assertEqual(import_snapshot(data, self.logger, self.firewall), (2, 0))
+        self.assertEqual(self.rows(), rows)
+        self.assertEqual(self.firewall.get_blocked_ips(), ['203.0.113.7'])
+
+    def test_export_import_round_trip(self):
+        self.block('203.0.113.7', self.now + timedelta(hours=1), 3)
+        data = export_snapshot(self.logger)
+
+        other_dir = tempfile.mkdtemp()
+        other = Logger({
+            'logging': {'file_path': os.path.join(other_dir, 'autoshield.log'), 'level': 'INFO', 'console': False},
+            'database': {'path': os.path.join(other_dir, 'database.db')},
+        })
+        try:
+            other_firewall = Firewall({}, other, backend=MemoryBackend())
+            import_snapshot(data, other, other_firewall)
+            self.assertEqual(other.get_offenders(), [('203.0.113.7', self.now + timedelta(hours=1), 3)])
+            self.assertEqual(other_firewall.get_blocked_ips(), ['203.0.113.7'])
+        finally:
+            other.close()
+            shutil.rmtree(other_dir)
+
+if __name__ == '__main__':
+    unittest.main()
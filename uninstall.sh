@@ -68,6 +68,11 @@ rm -f /var/log/autoshield.log
 rm -f /var/log/autoshield-web.log
 
 
+echo "Removing autoshield user and group..."
+userdel autoshield 2>/dev/null || true
+groupdel autoshield 2>/dev/null || true
+
+
 echo "Cleaning up Python cache files..."
 if [ -d "$REPO_DIR" ]; then
     find "$REPO_DIR" -name "__pycache__" -type d -exec rm -rf {} + 2>/dev/null || true
@@ -1,38 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, current_app
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime
 import sys
 import os
 import yaml
 import json
 import re
+import io
+import base64
 
 # Add parent directory to path so we can import the src modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from src.firewall import Firewall
-from src.logger import Logger
+from src.logger import OFFENDERS_QUERY
+from src.snapshot import encode_snapshot
+from src.control import ControlClient, ControlError, socket_path
 
-app = Flask(__name__)
-app.secret_key = 'autoshield_secret_key'  # Used for flash messages
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yaml')
 
-# Load config
-CONFIG_PATH = os.environ.get('AUTOSHIELD_CONFIG', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yaml'))
-try:
-    with open(CONFIG_PATH, 'r') as f:
-        config = yaml.safe_load(f)
-except Exception as e:
-    print(f"Error loading configuration: {e}")
-    sys.exit(1)
-
-# Initialize logger and firewall
-try:
-    logger = Logger(config)
-    firewall = Firewall(config, logger)
-except Exception as e:
-    print(f"Error initializing services: {e}")
-    sys.exit(1)
+# Dashboard queries, also run through EXPLAIN QUERY PLAN by scripts/loadtest.py
+RECENT_ATTEMPTS_QUERY = """
+    SELECT ip, timestamp, details 
+    FROM attempts 
+    ORDER BY timestamp DESC 
+    LIMIT 20
+"""
 
-DB_PATH = config['database']['path']
+ACTIVE_BLOCKS_QUERY = """
+    SELECT b.ip, b.block_timestamp, b.expiry_timestamp, b.block_count 
+    FROM blocks b
+    INNER JOIN (
+        SELECT ip, MAX(id) as max_id
+        FROM blocks
+        GROUP BY ip
+    ) m ON b.ip = m.ip AND b.id = m.max_id
+    WHERE b.expiry_timestamp > datetime('now')
+    ORDER BY b.block_timestamp DESC
+"""
 
 def format_datetime(dt_value):
     """Format datetime values for display"""
@@ -72,34 +75,49 @@ def parse_details(details_str):
     except:
         return "Failed login attempt"
 
+class Services:
+    """
+    Per-worker services, created on first use. The webapp only reads the
+    database; firewall changes are sent to the daemon's control socket.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.db_path = config['database']['path']
+        self.mode = (config.get('webapp') or {}).get('mode', 'control')
+        self._control = None
+    
+    @property
+    def read_only(self):
+        return self.mode == 'readonly'
+    
+    @property
+    def control(self):
+        if self._control is None:
+            self._control = ControlClient(socket_path(self.config))
+        return self._control
+
+def services():
+    return current_app.extensions['autoshield']
+
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(f"file:{services().db_path}?mode=ro", uri=True)
     conn.row_factory = sqlite3.Row
     return conn
 
-@app.route('/')
+def require_control():
+    """Flash an error and return False when changes are disabled"""
+    if services().read_only:
+        flash('The dashboard is in read-only mode', 'warning')
+        return False
+    return True
+
 def index():
     try:
         conn = get_db_connection()
         
-        attempts = conn.execute("""
-            SELECT ip, timestamp, details 
-            FROM attempts 
-            ORDER BY timestamp DESC 
-            LIMIT 20
-        """).fetchall()
+        attempts = conn.execute(RECENT_ATTEMPTS_QUERY).fetchall()
         
-        blocks = conn.execute("""
-            SELECT b.ip, b.block_timestamp, b.expiry_timestamp, b.block_count 
-            FROM blocks b
-            INNER JOIN (
-                SELECT ip, MAX(id) as max_id
-                FROM blocks
-                GROUP BY ip
-            ) m ON b.ip = m.ip AND b.id = m.max_id
-            WHERE b.expiry_timestamp > datetime('now')
-            ORDER BY b.block_timestamp DESC
-        """).fetchall()
+        blocks = conn.execute(ACTIVE_BLOCKS_QUERY).fetchall()
         
         # Format the data
         formatted_attempts = []
@@ -116,23 +134,23 @@ def index():
             formatted_block['formatted_expiry_timestamp'] = format_datetime(block['expiry_timestamp'])
             formatted_blocks.append(formatted_block)
         
-        # Get current firewall status
+        # Get current firewall status from the daemon
         try:
-            firewall_blocks = firewall.get_blocked_ips()
+            firewall_blocks = services().control.request('blocked')
         except Exception as e:
             firewall_blocks = []
-            flash(f"Unable to retrieve current firewall status: {str(e)}", "warning")
+            flash(f"Unable to retrieve current firewall status: {str(e)}", "danger")
         
         conn.close()
         return render_template('index.html', 
                               attempts=formatted_attempts, 
                               blocks=formatted_blocks, 
                               firewall_blocks=firewall_blocks,
+                              read_only=services().read_only,
                               now=datetime.now())
     except Exception as e:
-        return render_template('error.html', error=str(e))
+        return render_template('error.html', error=str(e)), 500
 
-@app.route('/block', methods=['POST'])
 def add_block():
     ip = request.form.get('ip')
     try:
@@ -150,15 +168,14 @@ def add_block():
     #     flash('Invalid IP address format', 'danger')
     #     return redirect(url_for('index'))
     
+    if not require_control():
+        return redirect(url_for('index'))
+    
     try:
-        # Block the IP
-        success = firewall.block_ip(ip)
+        # Block the IP and record it, done by the daemon
+        success = services().control.request('block', ip=ip, duration=duration)
         
         if success:
-            # Add to database
-            block_start = datetime.now()
-            block_end = block_start + timedelta(minutes=duration)
-            logger.log_block(ip, block_start, block_end)
             flash(f'Successfully blocked IP {ip} for {duration} minutes', 'success')
         else:
             flash(f'Failed to block IP {ip}. It may be whitelisted or already blocked.', 'warning')
@@ -167,14 +184,15 @@ def add_block():
     
     return redirect(url_for('index'))
 
-@app.route('/unblock/<ip>', methods=['POST'])
 def remove_block(ip):
+    if not require_control():
+        return redirect(url_for('index'))
+    
     try:
-        # Unblock the IP
-        success = firewall.unblock_ip(ip)
+        # Unblock the IP, done by the daemon
+        success = services().control.request('unblock', ip=ip)
         
         if success:
-            logger.log_unblock(ip)
             flash(f'Successfully unblocked IP {ip}', 'success')
         else:
             flash(f'Failed to unblock IP {ip}. It may not be blocked.', 'warning')
@@ -183,18 +201,89 @@ def remove_block(ip):
     
     return redirect(url_for('index'))
 
-@app.errorhandler(404)
+def download_snapshot():
+    try:
+        conn = get_db_connection()
+        offenders = [
+            (row['ip'], datetime.fromisoformat(row['expiry_timestamp']), row['block_count'])
+            for row in conn.execute(OFFENDERS_QUERY)
+        ]
+        conn.close()
+        data = encode_snapshot(offenders)
+    except Exception as e:
+        flash(f'Error exporting snapshot: {str(e)}', 'danger')
+        return redirect(url_for('index'))
+    
+    filename = f"autoshield-{datetime.now().strftime('%Y%m%d-%H%M%S')}.snapshot"
+    return send_file(io.BytesIO(data), mimetype='application/octet-stream',
+                     as_attachment=True, download_name=filename)
+
+def upload_snapshot():
+    if not require_control():
+        return redirect(url_for('index'))
+    
+    snapshot = request.files.get('snapshot')
+    if not snapshot:
+        flash('Snapshot file is required', 'danger')
+        return redirect(url_for('index'))
+    
+    try:
+        result = services().control.request(
+            'import_snapshot', data=base64.b64encode(snapshot.read()).decode('ascii')
+        )
+        flash(f"Imported {result['records']} records from snapshot, blocked {result['blocked']} IPs", 'success')
+    except Exception as e:
+        flash(f'Error importing snapshot: {str(e)}', 'danger')
+    
+    return redirect(url_for('index'))
+
+def get_traces():
+    # Live traces from the daemon, or the last SIGUSR1 dump if it is unreachable
+    try:
+        return jsonify(services().control.request('traces'))
+    except ControlError:
+        pass
+    
+    dump_path = (services().config.get('tracing') or {}).get('dump_path')
+    if not dump_path or not os.path.exists(dump_path):
+        return jsonify({'error': 'No traces available, the daemon is unreachable and has not dumped any'}), 404
+    return send_file(dump_path, mimetype='application/json')
+
 def page_not_found(e):
     return render_template('error.html', error="Page not found"), 404
 
-@app.errorhandler(500)
 def internal_server_error(e):
     return render_template('error.html', error="Internal server error"), 500
 
+def create_app(config_path=None):
+    """
+    Create the dashboard app. Nothing touches nftables or writes the
+    database, so workers start quickly and run without root, e.g.
+    gunicorn -w 4 'webapp.webapp:create_app()'
+    """
+    config_path = config_path or os.environ.get('AUTOSHIELD_CONFIG', DEFAULT_CONFIG_PATH)
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    
+    app = Flask(__name__)
+    app.secret_key = 'autoshield_secret_key'  # Used for flash messages
+    app.extensions['autoshield'] = Services(config)
+    
+    app.add_url_rule('/', view_func=index)
+    app.add_url_rule('/block', view_func=add_block, methods=['POST'])
+    app.add_url_rule('/unblock/<ip>', view_func=remove_block, methods=['POST'])
+    app.add_url_rule('/snapshot', view_func=download_snapshot, methods=['GET'])
+    app.add_url_rule('/snapshot', view_func=upload_snapshot, methods=['POST'])
+    app.add_url_rule('/api/traces', view_func=get_traces)
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(500, internal_server_error)
+    return app
+
 if __name__ == '__main__':
-    # Check if running as root
-    if os.geteuid() != 0:
-        print("Warning: This application requires root privileges to modify firewall rules.")
-        print("Consider running with sudo.")
+    try:
+        app = create_app()
+    except Exception as e:
+        print(f"Error loading configuration: {e}")
+        sys.exit(1)
     
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file